@@ -1,12 +1,92 @@
+import argparse
+import logging
+import os
+import threading
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog, colorchooser
-import qrcode
-from PIL import Image, ImageTk
+from concurrent.futures import ThreadPoolExecutor
+
+import qr_profile
+
+# The rendering stack (numpy, PIL, qrcode) takes longer to import than the
+# window takes to build, so it loads in load_modules once the window is up
+Image = ImageTk = qr_decode = qr_engine = qr_structured = None
+_modules_lock = threading.Lock()
+
+
+def load_modules():
+    """Import the rendering modules on first call; safe from any thread."""
+    global Image, ImageTk, qr_decode, qr_engine, qr_structured
+    with _modules_lock:
+        if qr_structured is not None:
+            return
+        from PIL import Image, ImageTk
+        import qr_decode
+        import qr_engine
+        import qr_structured
+
+
+class PreviewSurface:
+    """The preview panel's one PhotoImage, redrawn in place.
+
+    Every preview is drawn onto a persistent RGBA canvas the size of the
+    panel and pasted into the same PhotoImage, so the label never swaps
+    images (no flicker) and no panel-sized image is allocated per update.
+    Codes come as a qr_engine.preview_mask; a color change only swaps the
+    palette of the surface's copy of it and repaints.
+    """
+
+    def __init__(self, size, background):
+        self.size = size
+        self.background = background
+        self.canvas = Image.new("RGBA", (size, size), background)
+        self.photo = ImageTk.PhotoImage(self.canvas)
+        self.box = None  # Canvas area of the last code; the rest is background
+        self.mask = None  # The preview_mask last shown, and our copy of it
+        self.indices = None
+
+    def _fill(self, box=None):
+        self.canvas.paste(self.background, (0, 0, self.size, self.size))
+        self.box = box
+
+    def clear(self):
+        self._fill()
+        self.photo.paste(self.canvas)
+
+    def show_code(self, mask, fill_color, back_color, logo=None):
+        """Paint a preview mask in the given colors, with the logo placed like embed_logo does."""
+        if mask is not self.mask:
+            self.mask = mask
+            self.indices = mask.copy()  # The cached mask stays without a palette
+        width, height = mask.size
+        x, y = self._offset(mask)
+        box = (x, y, x + width, y + height)
+        if box != self.box:
+            self._fill(box)
+        # A transparent color shows the panel, as it would behind a transparent image
+        colors = [qr_engine.color_rgba(back_color), qr_engine.color_rgba(fill_color)]
+        self.indices.putpalette(bytes(channel for color in colors
+                                      for channel in (color if color[3] else self.background)[:3]))
+        self.canvas.paste(self.indices, box)
+        if logo is not None:
+            tile = logo.tile(width)
+            self.canvas.alpha_composite(tile, (x + (width - tile.size[0]) // 2, y + (height - tile.size[1]) // 2))
+        self.photo.paste(self.canvas)
+
+    def show_image(self, image):
+        """Show a finished RGBA image, such as a structured append strip."""
+        self._fill()
+        self.canvas.alpha_composite(image, self._offset(image))
+        self.photo.paste(self.canvas)
+
+    def _offset(self, image):
+        return (self.size - image.size[0]) // 2, (self.size - image.size[1]) // 2
 
 
 class QRCodeGeneratorApp:
-    def __init__(self, root):
+    def __init__(self, root, show_stats=False):
         self.root = root
+        self.show_stats = show_stats  # Per-stage timings overlay under the preview
 
         # Initial language setting: 'ar' for Arabic, 'en' for English
         self.language = 'ar'
@@ -27,9 +107,18 @@ class QRCodeGeneratorApp:
         # Default customization
         self.fill_color = "black"
         self.back_color = "white"
-        self.logo = None  # PIL image for the logo
+        self.logo = None  # qr_engine.PreparedLogo for the logo
         self.after_id = None  # For debouncing
-        self.qr_image = None  # The generated QR image
+        self.qr_request = None  # (data, options) behind the current preview
+        self.qr_image = None  # Full-resolution image, rendered on first save
+        self.qr_symbols = None  # qr_structured.Symbols when the data is split over several codes
+        self.preview_surface = None  # PreviewSurface, created with the first preview
+        self.error_color = "#FF5252"
+
+        # Rendering runs on a worker thread; each request gets a new token so
+        # results from earlier keystrokes can be dropped
+        self.render_executor = ThreadPoolExecutor(max_workers=1)
+        self.render_token = 0
 
         # Translations for Arabic and English
         # You can tweak these texts as needed
@@ -64,9 +153,17 @@ class QRCodeGeneratorApp:
                 'choose_back_color': "اختر لون الخلفية",
                 'choose_logo_error': "فشل في تحميل الشعار",
                 'generate_error': "فشل في إنشاء رمز QR",
-                'embed_logo_error': "فشل في إدراج الشعار",
                 'save_dialog_title': "حفظ رمز QR",
                 'save_dialog_png': "ملفات PNG",
+                'save_dialog_svg': "ملفات SVG",
+                'save_dialog_pdf': "ملفات PDF",
+                'save_dialog_webp': "ملفات WebP",
+                'save_dialog_tiff': "ملفات TIFF",
+                'split_label': "تقسيم البيانات الطويلة على عدة رموز (إلحاق منظم)",
+                'split_hint': "تلميح: فعّل خيار التقسيم لتوزيع البيانات الطويلة على عدة رموز أصغر.",
+                'verify_label': "التحقق من إمكانية مسح الرمز",
+                'verify_ok': "يمكن مسح الرمز: استُخدم {errors} من {capacity} أخطاء قابلة للتصحيح (الهامش المتبقي {margin:.0%})",
+                'verify_failed': "لا يمكن مسح الرمز! ارفع مستوى تصحيح الخطأ أو أزل الشعار.",
                 'save_failed': "فشل في حفظ رمز QR",
                 'logo_chosen': "تم اختيار الشعار",
                 'logo_cleared': "تم إزالة الشعار",
@@ -103,9 +200,17 @@ class QRCodeGeneratorApp:
                 'choose_back_color': "Select Background Color",
                 'choose_logo_error': "Failed to load logo",
                 'generate_error': "Failed to generate QR code",
-                'embed_logo_error': "Failed to embed logo",
                 'save_dialog_title': "Save QR Code",
                 'save_dialog_png': "PNG Files",
+                'save_dialog_svg': "SVG Files",
+                'save_dialog_pdf': "PDF Files",
+                'save_dialog_webp': "WebP Files",
+                'save_dialog_tiff': "TIFF Files",
+                'split_label': "Split long data over several codes (structured append)",
+                'split_hint': "Tip: turn on splitting to spread long data over several smaller codes.",
+                'verify_label': "Check that the code scans",
+                'verify_ok': "Scans: {errors} of {capacity} correctable errors used ({margin:.0%} margin left)",
+                'verify_failed': "Does not scan! Raise the error correction level or remove the logo.",
                 'save_failed': "Failed to save QR code",
                 'logo_chosen': "Logo selected",
                 'logo_cleared': "Logo cleared",
@@ -118,6 +223,13 @@ class QRCodeGeneratorApp:
         self.build_ui()
         self.update_texts()
 
+        # Import the renderer on the render thread as soon as the window is
+        # idle; a generation requested before that waits in the queue behind it
+        self.root.after_idle(self.preload_modules)
+
+    def preload_modules(self):
+        self.render_executor.submit(load_modules)
+
     def build_ui(self):
         # Header
         self.header_label = tk.Label(
@@ -237,6 +349,30 @@ class QRCodeGeneratorApp:
         )
         self.clear_logo_button.pack(side="left", padx=5)
 
+        # Structured append
+        split_frame = tk.Frame(self.custom_frame, bg=self.card_bg)
+        split_frame.pack(pady=5, padx=5, fill="x")
+        self.split_var = tk.BooleanVar(value=False)
+        self.split_check = tk.Checkbutton(
+            split_frame, font=("Segoe UI", 12), variable=self.split_var,
+            fg=self.text_color, bg=self.card_bg, selectcolor=self.card_bg,
+            activebackground=self.card_bg, activeforeground=self.text_color,
+            cursor="hand2", command=self.generate_qr_code
+        )
+        self.split_check.pack(side="left", padx=5)
+
+        # Decode-back check
+        verify_frame = tk.Frame(self.custom_frame, bg=self.card_bg)
+        verify_frame.pack(pady=5, padx=5, fill="x")
+        self.verify_var = tk.BooleanVar(value=False)
+        self.verify_check = tk.Checkbutton(
+            verify_frame, font=("Segoe UI", 12), variable=self.verify_var,
+            fg=self.text_color, bg=self.card_bg, selectcolor=self.card_bg,
+            activebackground=self.card_bg, activeforeground=self.text_color,
+            cursor="hand2", command=self.generate_qr_code
+        )
+        self.verify_check.pack(side="left", padx=5)
+
         # Action Buttons (Save, Reset, Language Toggle)
         self.button_frame = tk.Frame(self.root, bg=self.bg_color)
         self.button_frame.pack(pady=10)
@@ -294,6 +430,18 @@ class QRCodeGeneratorApp:
         )
         self.save_status_label.pack(pady=5)
 
+        # Stage timings overlay (only with --stats)
+        if self.show_stats:
+            self.stats_label = tk.Label(
+                self.root,
+                font=("Consolas", 9),
+                fg=self.button_hover_color,
+                bg=self.bg_color,
+                justify="left"
+            )
+            self.stats_label.pack()
+            qr_profile.add_sink(self.update_stats)
+
         # Footer
         self.footer_label = tk.Label(
             self.root,
@@ -335,6 +483,8 @@ class QRCodeGeneratorApp:
         self.logo_label.config(text=t['logo_label'])
         self.logo_button.config(text=t['logo_btn'])
         self.clear_logo_button.config(text=t['logo_clear_btn'])
+        self.split_check.config(text=t['split_label'])
+        self.verify_check.config(text=t['verify_label'])
 
         # Save and Reset buttons
         self.save_button.config(text=t['save_btn'])
@@ -394,7 +544,8 @@ class QRCodeGeneratorApp:
         )
         if file_path:
             try:
-                self.logo = Image.open(file_path).convert("RGBA")
+                load_modules()
+                self.logo = qr_engine.load_logo(file_path)
                 self.save_status_label.config(text=t['logo_chosen'], fg=self.accent_color)
                 self.generate_qr_code()
             except Exception as e:
@@ -417,76 +568,155 @@ class QRCodeGeneratorApp:
         if not data:
             self.clear_preview()
             return
+        self.render_token += 1
+        token = self.render_token
+        options = {
+            'error_correction': self.ec_var.get(),
+            'fill_color': self.fill_color,
+            'back_color': self.back_color,
+            'logo': self.logo,
+        }
+        split = self.split_var.get()
+        verify = self.verify_var.get()
+        trace = qr_profile.start_trace("generate", length=len(data), ec=options['error_correction'],
+                                       split=split, verify=verify)
+        future = self.render_executor.submit(self.render_in_background, token, trace, data, options, split, verify)
+        self.poll_render(future, token, trace)
+
+    def render_in_background(self, token, trace, data, options, split=False, verify=False):
+        """Runs on the worker thread; must not touch any Tk widget."""
+        if token != self.render_token:
+            return None
+        load_modules()
+        with qr_profile.activate(trace):
+            if not split:
+                # Only the mask is made here; show_preview colors it on the Tk thread
+                preview = qr_engine.preview_mask(data, error_correction=options['error_correction'])
+                if options['logo'] is not None:
+                    options['logo'].tile(preview.size[0])  # Resize the logo off the Tk thread
+                symbols = None
+            else:
+                # Symbols stay small (version 10 at most), so encoding them here
+                # takes a few milliseconds each
+                symbols = qr_structured.encode_symbols(data, options['error_correction'])
+                preview = qr_structured.preview_strip(
+                    symbols, fill_color=options['fill_color'], back_color=options['back_color'], logo=options['logo']
+                )
+            verification = self.verify_render(data, options, symbols) if verify else None
+            return (data, options), preview, symbols, verification
+
+    def verify_render(self, data, options, symbols=None):
+        """Decode the full-size render back; for a split, the worst of all symbols."""
+        with qr_profile.stage("verify"):
+            if symbols is None:
+                return qr_decode.verify(qr_engine.render_qr(data, **options), data)
+            colors = {k: options[k] for k in ('fill_color', 'back_color', 'logo')}
+            checks = [qr_decode.verify(qr_structured.render_symbol(symbol, **colors), symbol.text)
+                      for symbol in symbols]
+            return min(checks, key=lambda check: (check.ok, check.margin))
+
+    def poll_render(self, future, token, trace=None):
+        if token != self.render_token:
+            return  # A newer request superseded this one
+        if not future.done():
+            self.root.after(15, self.poll_render, future, token, trace)
+            return
         t = self.translations[self.language]
+        error = None
         try:
-            ec_mapping = {
-                "L": qrcode.constants.ERROR_CORRECT_L,
-                "M": qrcode.constants.ERROR_CORRECT_M,
-                "Q": qrcode.constants.ERROR_CORRECT_Q,
-                "H": qrcode.constants.ERROR_CORRECT_H
-            }
-            error_correction = ec_mapping.get(self.ec_var.get(), qrcode.constants.ERROR_CORRECT_L)
-            qr = qrcode.QRCode(
-                version=1,
-                error_correction=error_correction,
-                box_size=10,
-                border=2,
-            )
-            qr.add_data(data)
-            qr.make(fit=True)
-            self.qr_image = qr.make_image(fill_color=self.fill_color, back_color=self.back_color).convert("RGBA")
-            if self.logo:
-                self.qr_image = self.embed_logo(self.qr_image)
-            preview_image = self.qr_image.copy()
-            preview_image.thumbnail((250, 250))
-            self.img_tk = ImageTk.PhotoImage(preview_image)
-            self.preview_panel.config(image=self.img_tk)
-            self.preview_panel.image = self.img_tk
+            self.qr_request, preview_image, self.qr_symbols, verification = future.result()
+            self.qr_image = None
+            with qr_profile.activate(trace), qr_profile.stage("photo_upload"):
+                self.show_preview(preview_image, self.qr_request[1])
             self.save_button.config(state=tk.NORMAL)
             self.save_status_label.config(text="")
+            if verification is not None:
+                self.show_verification(verification)
         except Exception as e:
-            messagebox.showerror("Error", f"{t['generate_error']}:\n{e}")
+            error = e
+            if trace is not None:
+                trace.info["error"] = type(e).__name__
+        finally:
+            # Failed generations are traced and profiled too; finish before the
+            # error dialog so its wait isn't counted in the total
+            qr_profile.finish(trace)
+        if error is not None:
+            message = f"{t['generate_error']}:\n{error}"
+            overflow = qr_engine is not None and isinstance(error, qr_engine.DataOverflowError)
+            if overflow and not self.split_var.get():
+                message += f"\n\n{t['split_hint']}"
+            messagebox.showerror("Error", message)
             self.clear_preview()
 
-    def embed_logo(self, qr_img):
+    def show_preview(self, image, options):
+        if self.preview_surface is None:
+            self.preview_surface = PreviewSurface(qr_engine.PREVIEW_SIZE, qr_engine.color_rgba(self.preview_bg))
+            self.preview_panel.config(image=self.preview_surface.photo)
+        if self.qr_symbols is None:
+            self.preview_surface.show_code(image, options['fill_color'], options['back_color'], options['logo'])
+        else:
+            self.preview_surface.show_image(image)
+
+    def show_verification(self, verification):
         t = self.translations[self.language]
-        if not self.logo:
-            return qr_img
-        try:
-            qr_width, qr_height = qr_img.size
-            logo_size = int(qr_width * 0.2)
-            logo = self.logo.copy()
-            try:
-                from PIL import Resampling
-                RESAMPLE_MODE = Resampling.LANCZOS
-            except ImportError:
-                try:
-                    RESAMPLE_MODE = Image.LANCZOS
-                except AttributeError:
-                    RESAMPLE_MODE = Image.BICUBIC
-            logo.thumbnail((logo_size, logo_size), RESAMPLE_MODE)
-            pos = ((qr_width - logo.size[0]) // 2, (qr_height - logo.size[1]) // 2)
-            qr_img.paste(logo, pos, logo)
-        except Exception as e:
-            messagebox.showerror("Error", f"{t['embed_logo_error']}:\n{e}")
-        return qr_img
+        if verification.ok:
+            text = t['verify_ok'].format(
+                errors=verification.errors, capacity=verification.capacity, margin=verification.margin
+            )
+            self.save_status_label.config(text=text, fg=self.accent_color)
+        else:
+            self.save_status_label.config(text=t['verify_failed'], fg=self.error_color)
 
     def save_qr_code(self):
         t = self.translations[self.language]
-        if self.qr_image is None:
+        if self.qr_request is None:
             return
+        filetypes = [
+            (t['save_dialog_png'], "*.png"),
+            (t['save_dialog_svg'], "*.svg"),
+            (t['save_dialog_pdf'], "*.pdf"),
+            (t['save_dialog_webp'], "*.webp"),
+        ]
+        if self.qr_symbols is not None:
+            filetypes.append((t['save_dialog_tiff'], "*.tif;*.tiff"))
         save_path = filedialog.asksaveasfilename(
             defaultextension=".png",
-            filetypes=[(t['save_dialog_png'], "*.png"), ("All Files", "*.*")],
+            filetypes=filetypes + [("All Files", "*.*")],
             title=t['save_dialog_title']
         )
         if save_path:
+            data, options = self.qr_request
+            extension = os.path.splitext(save_path)[1].lower()
+            trace = qr_profile.start_trace("save", format=extension)
             try:
-                self.qr_image.save(save_path)
+                with qr_profile.activate(trace):
+                    if self.qr_symbols is not None:
+                        # PDF/TIFF: one sheet with every code; otherwise one file per code
+                        colors = {k: options[k] for k in ('fill_color', 'back_color', 'logo')}
+                        if qr_structured.is_sheet_path(save_path):
+                            qr_structured.save_sheet(save_path, self.qr_symbols, **colors)
+                        else:
+                            qr_structured.save_set(save_path, self.qr_symbols, **colors)
+                    elif extension in (".png", ".webp", ".svg", ".pdf"):
+                        # Palette PNG, lossless WebP or vector output from the module matrix
+                        payload = qr_engine.render_qr_bytes(data, format=extension[1:], **options)
+                        with qr_profile.stage("write"), open(save_path, "wb") as f:
+                            f.write(payload)
+                    else:
+                        if self.qr_image is None:
+                            self.qr_image = qr_engine.render_qr(data, **options)
+                        with qr_profile.stage("write"):
+                            self.qr_image.save(save_path)
+                qr_profile.finish(trace)
                 self.save_status_label.config(text=f"{t['save_status']} {save_path}", fg=self.accent_color)
             except Exception as e:
                 messagebox.showerror("Error", f"{t['save_failed']}:\n{e}")
 
+    def update_stats(self, record):
+        """Trace sink for the --stats overlay; traces finish on the Tk thread."""
+        stages = "  ".join(f"{name} {seconds * 1000:.1f}" for name, seconds in record['stages'].items())
+        self.stats_label.config(text=f"{record['operation']} {record['total'] * 1000:.1f} ms | {stages}")
+
     def reset_app(self):
         t = self.translations[self.language]
         self.entry.delete(0, tk.END)
@@ -496,16 +726,45 @@ class QRCodeGeneratorApp:
         self.fill_color_button.config(text=self.fill_color)
         self.back_color_button.config(text=self.back_color)
         self.logo = None
+        self.split_var.set(False)
+        self.verify_var.set(False)
         self.clear_preview()
         self.save_status_label.config(text=t['reset_text'])
 
     def clear_preview(self):
-        self.preview_panel.config(image="", bg=self.preview_bg)
+        self.render_token += 1  # Drop any render still in flight
+        if self.preview_surface is not None:
+            self.preview_surface.clear()
         self.save_button.config(state=tk.DISABLED)
+        self.qr_request = None
         self.qr_image = None
+        self.qr_symbols = None
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="QR Code Generator")
+    parser.add_argument("--stats", action="store_true", help="show per-stage timings under the preview")
+    parser.add_argument("--log-timings", action="store_true", help="log per-stage timings to stderr")
+    parser.add_argument("--trace", metavar="FILE", help="append per-stage timings to a JSONL file")
+    parser.add_argument("--profile", type=int, default=0, metavar="N",
+                        help="capture cProfile stats for the next N generations/saves")
+    parser.add_argument("--profile-dir", default="profiles", help="where --profile writes .prof files")
+    parser.add_argument("--eager", action="store_true",
+                        help="import the renderer before showing the window instead of in the background")
+    return parser.parse_args(argv)
 
 
 if __name__ == "__main__":
+    args = parse_args()
+    if args.log_timings:
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+        qr_profile.add_sink(qr_profile.LogSink())
+    if args.trace:
+        qr_profile.add_sink(qr_profile.JSONLSink(args.trace))
+    if args.profile:
+        qr_profile.profile_next(args.profile, args.profile_dir)
+    if args.eager:
+        load_modules()
     root = tk.Tk()
-    app = QRCodeGeneratorApp(root)
+    app = QRCodeGeneratorApp(root, show_stats=args.stats)
     root.mainloop()
@@ -0,0 +1,50 @@
+"""Compare qrcode's per-module PIL drawing with the NumPy rasterizer.
+
+Usage:
+    python -m benchmarks.bench_raster [--box-size 10] [--repeat 5]
+"""
+import argparse
+import time
+
+import qr_engine
+
+# Payload lengths (byte mode, EC level L) that land on a spread of versions
+PAYLOAD_LENGTHS = (10, 100, 500, 1000, 2000, 2900)
+
+
+def best_time(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--box-size", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--fill", default="#1A237E")
+    parser.add_argument("--back", default="white")
+    args = parser.parse_args(argv)
+
+    print(f"{'version':>7} {'pixels':>7} {'qrcode (ms)':>12} {'numpy (ms)':>11} {'speedup':>8}")
+    for length in PAYLOAD_LENGTHS:
+        qr = qr_engine.make_qr("x" * length, "L", box_size=args.box_size)
+        modules, version = qr_engine.encode("x" * length, "L")
+
+        def pil_path():
+            qr.make_image(fill_color=args.fill, back_color=args.back).convert("RGBA")
+
+        def numpy_path():
+            qr_engine.rasterize(modules, args.box_size, args.fill, args.back)
+
+        old = best_time(pil_path, args.repeat)
+        new = best_time(numpy_path, args.repeat)
+        size = len(modules) * args.box_size
+        print(f"{version:>7} {size:>7} {old * 1000:>12.2f} {new * 1000:>11.2f} {old / new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
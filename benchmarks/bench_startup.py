@@ -0,0 +1,144 @@
+"""Cold start benchmark of the desktop app.
+
+Usage:
+    python -m benchmarks.bench_startup -o startup.json
+    python -m benchmarks.bench_startup --compare startup.json --threshold 0.2
+
+Every measurement runs in a fresh interpreter, --repeat times, and the
+median is reported:
+
+    interpreter      python -c pass, for reference
+    app_import       import QRcodeV1 (what happens before the window)
+    renderer_import  load_modules(): numpy, PIL, qrcode and the qr_* modules
+    first_render     the first preview render after load_modules()
+    window           Tk root and app built and drawn (skipped without a display)
+
+The run fails if importing QRcodeV1 pulls in any of HEAVY_MODULES, or,
+with --compare, if a measurement got slower than the baseline by more
+than --threshold.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules the app must not import before its window is up
+HEAVY_MODULES = ("numpy", "PIL.Image", "qrcode")
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import QRcodeV1
+app_import = time.perf_counter() - start
+leaked = [name for name in %(heavy)r if name in sys.modules]
+timings = {"app_import": app_import}
+if %(window)r:
+    import tkinter as tk
+    start = time.perf_counter()
+    root = tk.Tk()
+    app = QRcodeV1.QRCodeGeneratorApp(root)
+    root.update()
+    timings["window"] = time.perf_counter() - start
+    app.render_executor.shutdown(wait=True)
+    root.destroy()
+start = time.perf_counter()
+QRcodeV1.load_modules()
+timings["renderer_import"] = time.perf_counter() - start
+start = time.perf_counter()
+QRcodeV1.qr_engine.render_preview("https://example.com/startup")
+timings["first_render"] = time.perf_counter() - start
+print(json.dumps({"timings": timings, "leaked": leaked}))
+"""
+
+
+def has_display():
+    return sys.platform in ("win32", "darwin") or bool(os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY"))
+
+
+def run_probe(window):
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "pass"], check=True, cwd=ROOT, env=env)
+    interpreter = time.perf_counter() - start
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE % {"heavy": HEAVY_MODULES, "window": window}],
+        check=True, cwd=ROOT, env=env, capture_output=True, text=True,
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result["timings"]["interpreter"] = interpreter
+    return result
+
+
+def compare(results, baseline, threshold, min_seconds):
+    """Measurements slower than baseline by more than threshold, as (name, old, new)."""
+    regressions = []
+    for name, new in results.items():
+        old = baseline.get("results", {}).get(name)
+        if old is None or max(old, new) < min_seconds:
+            continue
+        if new > old * (1 + threshold):
+            regressions.append((name, old, new))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--no-window", action="store_true", help="skip the window measurement even with a display")
+    parser.add_argument("-o", "--output", help="write JSON results here")
+    parser.add_argument("--compare", help="baseline JSON from an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown, 0.2 = 20%%")
+    parser.add_argument("--min-seconds", type=float, default=0.005,
+                        help="ignore measurements faster than this in both runs (process noise)")
+    args = parser.parse_args(argv)
+
+    window = has_display() and not args.no_window
+    runs = [run_probe(window) for _ in range(args.repeat)]
+    names = runs[0]["timings"].keys()
+    results = {name: statistics.median(run["timings"][name] for run in runs) for name in names}
+    for name, seconds in results.items():
+        print(f"{name:<16} {seconds * 1000:8.1f} ms")
+    if not window:
+        print("window           skipped (no display)")
+
+    status = 0
+    leaked = sorted({name for run in runs for name in run["leaked"]})
+    if leaked:
+        print(f"REGRESSION importing QRcodeV1 loads {', '.join(leaked)} before the window is shown")
+        status = 1
+
+    if args.output:
+        report = {
+            "meta": {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "repeat": args.repeat,
+            },
+            "results": results,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=1)
+        print(f"Wrote {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, args.min_seconds)
+        for name, old, new in regressions:
+            print(f"REGRESSION {name}: {old * 1000:.1f} ms -> {new * 1000:.1f} ms ({new / old - 1:+.0%})")
+        if regressions:
+            status = 1
+        else:
+            print(f"No regressions above {args.threshold:.0%} against {args.compare}")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,249 @@
+"""Headless benchmark of the QR pipeline, stage by stage.
+
+Usage:
+    python -m benchmarks.bench_suite -o results.json
+    python -m benchmarks.bench_suite --compare baseline.json --threshold 0.2
+
+Sweeps QR version (via payload length), EC level, logo source size and
+box size, and times each stage of what generate_qr_code / embed_logo /
+save_qr_code do: encode, rasterize, logo preparation, logo compositing,
+preview, export and save. Each stage reports its best wall time over
+--repeat runs and the peak traced by tracemalloc (Python and NumPy
+allocations; PIL keeps image buffers outside of it).
+
+With --compare, stages that got slower than the baseline by more than
+--threshold are listed and the exit status is 1.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import string
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import PIL
+import qrcode.util
+from PIL import Image
+
+import qr_engine
+import qr_export
+
+DEFAULT_VERSIONS = (1, 10, 25, 40)
+DEFAULT_EC_LEVELS = ("L", "M", "Q", "H")
+DEFAULT_LOGO_SIZES = (0, 512, 2048)
+DEFAULT_BOX_SIZES = (4, 10)
+
+
+def payload_for_version(version, level):
+    """A byte-mode payload that just fills the given version at the given EC level."""
+    bits = qrcode.util.BIT_LIMIT_TABLE[qr_engine.error_correction_for(level)][version]
+    count_bits = qrcode.util.length_in_bits(qrcode.util.MODE_8BIT_BYTE, version)
+    length = (bits - 4 - count_bits) // 8
+    rng = random.Random(version * 10 + len(level))
+    # Lowercase letters keep the data in byte mode
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(length))
+
+
+def make_logo(size):
+    rng = np.random.default_rng(size)
+    yy, xx = np.mgrid[0:size, 0:size] / max(size - 1, 1)
+    pixels = np.empty((size, size, 4), dtype=np.uint8)
+    pixels[..., 0] = xx * 255
+    pixels[..., 1] = yy * 255
+    pixels[..., 2] = rng.integers(0, 256, (size, size))
+    pixels[..., 3] = np.where((xx - 0.5) ** 2 + (yy - 0.5) ** 2 < 0.25, 255, 0)
+    return Image.fromarray(pixels)
+
+
+def clear_caches():
+    qr_engine.matrix_cache.clear()
+    qr_engine.image_cache.clear()
+
+
+def measure(func, repeat, setup=None):
+    """Return (best seconds, peak traced bytes) for func()."""
+    best = float("inf")
+    for _ in range(repeat):
+        if setup:
+            setup()
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    if setup:
+        setup()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {"seconds": best, "peak_bytes": peak}
+
+
+def run_case(version, level, logo_size, box_size, logo_source, repeat, scratch):
+    data = payload_for_version(version, level)
+    stages = {}
+
+    def encode():
+        qr_engine.encode(data, level)
+
+    stages["encode"] = measure(encode, repeat, setup=clear_caches)
+    modules, actual_version = qr_engine.encode(data, level)
+
+    stages["rasterize"] = measure(lambda: qr_engine.rasterize(modules, box_size), repeat)
+
+    logo = None
+    if logo_source is not None:
+        stages["logo_prepare"] = measure(lambda: qr_engine.PreparedLogo(logo_source), repeat)
+        logo = qr_engine.PreparedLogo(logo_source)
+
+        def composite():
+            logo._tiles.clear()
+            qr_engine.embed_logo(qr_engine.rasterize(modules, box_size), logo)
+
+        stages["logo_composite"] = measure(composite, repeat)
+
+    options = {"error_correction": level, "logo": logo, "box_size": box_size}
+
+    def preview():
+        qr_engine.image_cache.clear()
+        qr_engine.render_preview(data, **options)
+
+    stages["preview"] = measure(preview, repeat)
+
+    def mask():
+        # What the app renders per preview; it colors the mask itself
+        qr_engine.image_cache.clear()
+        qr_engine.preview_mask(data, error_correction=level)
+
+    stages["preview_mask"] = measure(mask, repeat)
+
+    def export():
+        qr_engine.image_cache.clear()
+        return qr_export.export_qr(data, **options)
+
+    stages["export_png"] = measure(export, repeat)
+    payload = export().data
+
+    def save():
+        with open(scratch, "wb") as f:
+            f.write(payload)
+
+    stages["save"] = measure(save, repeat)
+
+    case = {"version": actual_version, "ec": level, "logo_size": logo_size,
+            "box_size": box_size, "payload_length": len(data), "png_bytes": len(payload)}
+    return case, stages
+
+
+def case_key(case):
+    return (case["version"], case["ec"], case["logo_size"], case["box_size"])
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold, min_seconds):
+    """Return (case, stage, old, new) for every stage slower than the threshold allows."""
+    old_cases = {case_key(entry["case"]): entry["stages"] for entry in baseline["results"]}
+    regressions = []
+    for entry in results:
+        old_stages = old_cases.get(case_key(entry["case"]))
+        if not old_stages:
+            continue
+        for stage, timing in entry["stages"].items():
+            old = old_stages.get(stage)
+            if not old or max(old["seconds"], timing["seconds"]) < min_seconds:
+                continue
+            if timing["seconds"] > old["seconds"] * (1 + threshold):
+                regressions.append((entry["case"], stage, old["seconds"], timing["seconds"]))
+    return regressions
+
+
+def int_list(text):
+    return tuple(int(item) for item in text.split(","))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--versions", type=int_list, default=DEFAULT_VERSIONS, help="comma separated, 1-40")
+    parser.add_argument("--ec", type=lambda text: tuple(text.upper().split(",")), default=DEFAULT_EC_LEVELS)
+    parser.add_argument("--logo-sizes", type=int_list, default=DEFAULT_LOGO_SIZES,
+                        help="logo source sizes in pixels, 0 for no logo")
+    parser.add_argument("--box-sizes", type=int_list, default=DEFAULT_BOX_SIZES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--encoder", choices=qr_engine.ENCODERS, default=qr_engine.encoder,
+                        help="matrix encoder behind the encode stage")
+    parser.add_argument("-o", "--output", help="write JSON results here")
+    parser.add_argument("--compare", help="baseline JSON from an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown, 0.2 = 20%%")
+    parser.add_argument("--min-seconds", type=float, default=0.0005,
+                        help="ignore stages faster than this in both runs (timer noise)")
+    args = parser.parse_args(argv)
+
+    qr_engine.set_encoder(args.encoder)
+    logos = {size: make_logo(size) if size else None for size in args.logo_sizes}
+    results = []
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        scratch = os.path.join(scratch_dir, "qr.png")
+        for version in args.versions:
+            for level in args.ec:
+                for logo_size in args.logo_sizes:
+                    for box_size in args.box_sizes:
+                        case, stages = run_case(version, level, logo_size, box_size,
+                                                logos[logo_size], args.repeat, scratch)
+                        results.append({"case": case, "stages": stages})
+                        timings = "  ".join(f"{name} {timing['seconds'] * 1000:.2f}"
+                                            for name, timing in stages.items())
+                        print(f"v{case['version']:<2} {level} logo={logo_size:<4} box={box_size:<2}  {timings} (ms)",
+                              flush=True)
+
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "pillow": PIL.__version__,
+            "repeat": args.repeat,
+            "encoder": args.encoder,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=1)
+        print(f"Wrote {len(results)} cases to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, args.min_seconds)
+        for case, stage, old, new in regressions:
+            print(f"REGRESSION v{case['version']} {case['ec']} logo={case['logo_size']} box={case['box_size']} "
+                  f"{stage}: {old * 1000:.2f} ms -> {new * 1000:.2f} ms ({new / old - 1:+.0%})")
+        if regressions:
+            return 1
+        print(f"No regressions above {args.threshold:.0%} against {args.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""Load test for qr_server over keep-alive connections.
+
+Usage:
+    python -m qr_server --port 8080 &
+    python -m benchmarks.load_test --url http://127.0.0.1:8080 -c 32 -n 5000
+
+--unique sets how many distinct payloads are cycled through, which controls
+the response cache hit rate.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from urllib.parse import quote, urlsplit
+
+
+async def worker(host, port, targets, latencies, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while targets:
+            target = targets.pop()
+            start = time.perf_counter()
+            writer.write(f"GET {target} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode("latin-1"))
+            await writer.drain()
+            head = await reader.readuntil(b"\r\n\r\n")
+            status = int(head.split(b" ", 2)[1])
+            length = 0
+            for line in head.split(b"\r\n"):
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":", 1)[1])
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def run(args):
+    url = urlsplit(args.url)
+    targets = [
+        f"/qr?data={quote(f'https://example.com/ticket/{i % args.unique}')}&ec={args.ec}"
+        for i in range(args.requests)
+    ]
+    targets.reverse()
+    latencies, errors = [], []
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        worker(url.hostname, url.port or 80, targets, latencies, errors)
+        for _ in range(args.concurrency)
+    ))
+    elapsed = time.perf_counter() - start
+
+    print(f"requests:    {len(latencies)} ({len(errors)} non-200)")
+    print(f"concurrency: {args.concurrency}")
+    print(f"elapsed:     {elapsed:.2f}s")
+    print(f"throughput:  {len(latencies) / elapsed:.1f} req/s")
+    print(f"latency p50: {percentile(latencies, 0.50) * 1000:.2f} ms")
+    print(f"latency p99: {percentile(latencies, 0.99) * 1000:.2f} ms")
+    print(f"latency avg: {statistics.mean(latencies) * 1000:.2f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8080")
+    parser.add_argument("-c", "--concurrency", type=int, default=16)
+    parser.add_argument("-n", "--requests", type=int, default=2000)
+    parser.add_argument("--unique", type=int, default=500, help="distinct payloads to cycle through")
+    parser.add_argument("--ec", default="M")
+    args = parser.parse_args(argv)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+"""Batch QR code generation from a CSV or JSONL file of payloads.
+
+Usage:
+    python -m qr_batch payloads.csv -o out/
+    python -m qr_batch payloads.jsonl -o out/ --ec H --logo logo.png
+    python -m qr_batch payloads.csv -o out/ --workers 8
+    python -m qr_batch payloads.csv -o out/ --format svg
+    python -m qr_batch payloads.csv -o out/ --compress-level 9 --optimize --report sizes.csv
+    python -m qr_batch payloads.csv -o out/ --logo logo.png --verify-rate 0.05
+    python -m qr_batch payloads.csv -o out/ --cache ~/.cache/qr --cache-size 2048
+
+CSV files need a 'data' column. JSONL lines are either JSON strings or
+objects with a 'data' key. Both may also set 'filename', 'ec', 'fill' and
+'back' per row to override the command line defaults.
+
+A row that can't be rendered (data too long for a code, an empty 'data',
+an unknown 'ec' or color) is reported on stderr and in the report's error
+column; the rest of the run goes on and the exit status is 1.
+
+--verify-rate decodes an evenly spread share of the codes back (see
+qr_decode) inside the worker processes and exits with status 1 if any
+of them doesn't round-trip.
+
+--cache keeps every file it renders in a content-addressed DiskCache
+(see qr_export.export_key); codes already in it are copied straight from
+the cache by the kernel, so a warm re-run of the same job is only file
+I/O. Codes picked for verification are always rendered and checked.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import shutil
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from PIL import Image
+
+import qr_decode
+import qr_engine
+import qr_export
+from qr_cache import DiskCache
+
+# Options render_qr takes, for checking vector output through its raster twin
+RENDER_OPTIONS = ("error_correction", "fill_color", "back_color", "box_size", "border")
+
+
+def read_jobs(path):
+    """Yield one dict per payload in a CSV or JSONL file."""
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.lower().endswith((".jsonl", ".ndjson", ".json")):
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                row = json.loads(line)
+                if isinstance(row, str):
+                    row = {"data": row}
+                elif not isinstance(row, dict) or "data" not in row:
+                    raise ValueError(f"{path}:{line_no}: expected a string or an object with 'data'")
+                yield row
+        else:
+            reader = csv.DictReader(f)
+            if not reader.fieldnames or "data" not in reader.fieldnames:
+                raise ValueError(f"{path}: CSV needs a 'data' column")
+            for row in reader:
+                yield row
+
+
+def row_data(row):
+    """The payload of a row as text.
+
+    Raises ValueError when it is missing: a JSON null, an empty cell, or
+    a CSV row shorter than the header (DictReader fills in None).
+    """
+    data = row.get("data")
+    if data is None or data == "":
+        raise ValueError("missing 'data'")
+    return str(data)
+
+
+def job_options(row, args):
+    """Merge per-row overrides with the command line defaults.
+
+    Raises ValueError for an unknown 'ec' level or a 'fill'/'back' color
+    PIL can't parse, the same checks the command line and qr_server make.
+    """
+    options = {
+        "error_correction": qr_engine.ec_level(row.get("ec") or args.ec),
+        "fill_color": str(row.get("fill") or args.fill),
+        "back_color": str(row.get("back") or args.back),
+        "box_size": args.box_size,
+        "border": args.border,
+        "format": args.format,
+        "compress_level": args.compress_level,
+        "optimize": args.optimize,
+    }
+    for name, key in (("fill", "fill_color"), ("back", "back_color")):
+        try:
+            qr_engine.color_rgba(options[key])
+        except ValueError:
+            raise ValueError(f"invalid color for '{name}': {options[key]!r}")
+    return options
+
+
+def sampled(index, rate):
+    """Whether job index is in the evenly spread share rate of jobs to verify."""
+    return int((index + 1) * rate) > int(index * rate)
+
+
+def output_path(row, index, args):
+    name = row.get("filename") or args.name.format(index=index)
+    if not os.path.splitext(name)[1]:
+        name += "." + args.format.lower()
+    return os.path.join(args.output_dir, name)
+
+
+# Logo loaded once per worker process by _init_worker
+_worker_logo = None
+
+
+def _init_worker(logo_path):
+    global _worker_logo
+    _worker_logo = qr_engine.load_logo(logo_path) if logo_path else None
+
+
+def verify_result(result, data, options, logo=None):
+    """Decode an ExportResult back and compare it with data; return a qr_decode.Verification.
+
+    Raster files are decoded as written. SVG and PDF are checked through
+    the raster render of the same options, which has the same geometry.
+    """
+    if result.format in qr_export.RASTER_FORMATS:
+        image = Image.open(io.BytesIO(result.data))
+    else:
+        image = qr_engine.render_qr(data, logo=logo, **{k: options[k] for k in RENDER_OPTIONS if k in options})
+    return qr_decode.verify(image, data)
+
+
+def render_job(data, options):
+    """Export one job; return (ExportResult, Verification or None, error).
+
+    The output is verified when options has verify=True. A job that fails
+    returns (None, None, message) instead of raising, so one bad payload
+    doesn't take the rest of its chunk or the run down with it.
+    """
+    options = dict(options)
+    verify = options.pop("verify", False)
+    try:
+        result = qr_export.export_qr(data, logo=_worker_logo, **options)
+        check = verify_result(result, data, options, _worker_logo) if verify else None
+    except Exception as e:
+        return None, None, f"{type(e).__name__}: {e}"
+    return result, check, None
+
+
+def _render_chunk(chunk):
+    return [render_job(data, options) for data, options in chunk]
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def render_ordered(jobs, workers=None, logo_path=None, chunksize=16, max_pending=None):
+    """Render (data, options) jobs over a process pool, yielding render_job results in input order.
+
+    Jobs are pulled lazily and at most max_pending chunks (default 2 per
+    worker) are in flight, so memory stays bounded however long the input
+    is and a slow consumer holds back the producers.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        _init_worker(logo_path)
+        for data, options in jobs:
+            yield render_job(data, options)
+        return
+
+    max_pending = max_pending or workers * 2
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(logo_path,)) as pool:
+        pending = deque()
+        for chunk in _chunks(jobs, chunksize):
+            if len(pending) >= max_pending:
+                yield from pending.popleft().result()
+            pending.append(pool.submit(_render_chunk, chunk))
+        while pending:
+            yield from pending.popleft().result()
+
+
+def write_file(path, payload):
+    with open(path, "wb") as f:
+        f.write(payload)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="qr_batch", description="Generate QR code images in bulk.")
+    parser.add_argument("input", help="CSV or JSONL file with the payloads")
+    parser.add_argument("-o", "--output-dir", default="qr_output", help="directory for the generated files")
+    parser.add_argument("--ec", default="L", choices=sorted(qr_engine.EC_LEVELS), help="error correction level")
+    parser.add_argument("--fill", default="black", help="module color")
+    parser.add_argument("--back", default="white", help="background color")
+    parser.add_argument("--logo", help="logo image embedded in every code")
+    parser.add_argument("--box-size", type=int, default=10, help="pixels per module")
+    parser.add_argument("--border", type=int, default=2, help="quiet zone in modules")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="worker processes (default: one per CPU, 1 renders in-process)")
+    parser.add_argument("--chunksize", type=int, default=16, help="payloads sent to a worker at a time")
+    parser.add_argument("--format", default="PNG", type=str.upper,
+                        choices=qr_export.RASTER_FORMATS + qr_export.VECTOR_FORMATS,
+                        help="output format; WEBP is lossless, SVG and PDF are built from the module matrix")
+    parser.add_argument("--compress-level", type=int, default=6, choices=range(10), metavar="0-9",
+                        help="zlib level for PNG, effort for WEBP (default: %(default)s)")
+    parser.add_argument("--optimize", action="store_true", help="let PNG search for the smallest encoding")
+    parser.add_argument("--report", help="CSV file to write the bytes, encode time and check of every file to")
+    parser.add_argument("--verify-rate", type=float, default=0.0, metavar="0-1",
+                        help="share of codes to decode back and check, e.g. 0.05 (default: none)")
+    parser.add_argument("--cache", metavar="DIR", help="disk cache of rendered files shared between runs")
+    parser.add_argument("--cache-size", type=int, default=1024, metavar="MB",
+                        help="largest total size of --cache before old files are evicted (default: %(default)s)")
+    parser.add_argument("--name", default="qr_{index:06d}",
+                        help="file name template for rows without a 'filename' (default: %(default)s)")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not 0 <= args.verify_rate <= 1:
+        parser.error("--verify-rate must be between 0 and 1")
+    os.makedirs(args.output_dir, exist_ok=True)
+    # Fail early on a bad logo, before starting workers
+    logo_digest = qr_engine.load_logo(args.logo).digest if args.logo else None
+    disk_cache = DiskCache(args.cache, args.cache_size << 20) if args.cache else None
+
+    report = None
+    if args.report:
+        report_file = open(args.report, "w", newline="", encoding="utf-8")
+        report = csv.writer(report_file)
+        report.writerow(["path", "bytes", "encode_ms", "verified", "ec_margin", "error"])
+
+    paths = deque()  # (output path, cache key) of the jobs sent to render
+    count = total_bytes = encode_seconds = cached = 0
+    errors = []
+
+    def report_error(path, message):
+        errors.append(path)
+        print(f"{path}: {message}", file=sys.stderr)
+        if report:
+            report.writerow([path, "", "", "", "", message])
+
+    def jobs():
+        nonlocal count, total_bytes, cached
+        for index, row in enumerate(read_jobs(args.input)):
+            path = output_path(row, index, args)
+            try:
+                data = row_data(row)
+                options = job_options(row, args)
+            except ValueError as e:
+                report_error(path, f"row {index + 1}: {e}")
+                continue
+            key = qr_export.export_key(data, logo_digest, **options) if disk_cache is not None else None
+            if sampled(index, args.verify_rate):
+                options["verify"] = True
+            elif key is not None:
+                source = disk_cache.path(key)
+                try:
+                    if source is not None:
+                        shutil.copyfile(source, path)
+                except FileNotFoundError:
+                    # Evicted by another process sharing the cache since path(): a miss
+                    source = None
+                if source is not None:
+                    nbytes = os.path.getsize(path)
+                    count += 1
+                    cached += 1
+                    total_bytes += nbytes
+                    if report:
+                        report.writerow([path, nbytes, "", "", "", ""])
+                    continue
+            paths.append((path, key))
+            yield data, options
+
+    start = time.perf_counter()
+    verified = []
+    failed = []
+    try:
+        for result, check, error in render_ordered(jobs(), args.workers, args.logo, args.chunksize):
+            path, key = paths.popleft()
+            if error is not None:
+                report_error(path, error)
+                continue
+            write_file(path, result.data)
+            if key is not None:
+                disk_cache.put(key, result.data)
+            count += 1
+            total_bytes += result.nbytes
+            encode_seconds += result.seconds
+            if check is not None:
+                verified.append((check.margin, path))
+                if not check.ok:
+                    failed.append(path)
+                    print(f"{path}: {qr_decode.describe(check)}", file=sys.stderr)
+            if report:
+                status = margin = ""
+                if check is not None:
+                    status = "ok" if check.ok else check.reason
+                    margin = f"{check.margin:.2f}"
+                report.writerow([path, result.nbytes, f"{result.seconds * 1000:.3f}", status, margin, ""])
+    finally:
+        if report:
+            report_file.close()
+    elapsed = time.perf_counter() - start
+
+    rate = count / elapsed if elapsed else 0.0
+    print(f"Wrote {count} codes to {args.output_dir} in {elapsed:.2f}s ({rate:.1f}/s)")
+    if count:
+        print(f"{total_bytes} bytes total, {total_bytes / count:.0f} bytes per file")
+    if count > cached:
+        print(f"{encode_seconds / (count - cached) * 1000:.2f} ms encode per rendered file")
+    if disk_cache is not None:
+        print(f"{cached} of {count} files copied from the cache in {args.cache}")
+    if verified:
+        margin, path = min(verified)
+        print(f"Verified {len(verified)} codes: {len(failed)} failed, "
+              f"smallest error correction margin {margin:.0%} ({path})")
+    if errors:
+        print(f"{len(errors)} codes could not be rendered (see above)")
+    return 1 if failed or errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,184 @@
+"""Caches shared by the renderer, the desktop app and the batch tools."""
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Bounded, thread-safe mapping that evicts the least recently used entry."""
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_create(self, key, factory):
+        """Return the cached value for key, calling factory() on a miss."""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = factory()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+
+_MISSING = object()
+
+# Temporary files older than this are left over from a crashed writer
+STALE_TEMP_SECONDS = 3600
+
+
+class DiskCache:
+    """Content-addressed files on disk, bounded by their total size.
+
+    Keys are hex digests (see qr_export.export_key) and name the files,
+    fanned out over 256 subdirectories. Writes go to a temporary file that
+    os.replace moves into place, so readers in other processes never see a
+    partial entry. A hit bumps the file's mtime; once the total passes
+    max_bytes the least recently used files are removed down to 90% of it.
+    """
+
+    def __init__(self, directory, max_bytes=1 << 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        # Other processes may share the directory, so this is only an estimate
+        # between the scans that evict() does
+        self._total = sum(size for _, size, _ in self._entries())
+
+    def path_for(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def path(self, key):
+        """Path of the entry for key, or None; counts as a use for eviction.
+
+        Callers that only copy or send the file (shutil.copyfile,
+        loop.sendfile) never have to read it into memory.
+        """
+        path = self.path_for(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return path
+
+    def get(self, key):
+        """The bytes stored for key, or None."""
+        path = self.path(key)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None  # Evicted by another process in between
+
+    def put(self, key, payload):
+        """Store payload under key atomically and return its path."""
+        path = self.path_for(key)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(payload)
+            os.replace(temp, path)
+        except BaseException:
+            try:
+                os.unlink(temp)
+            except FileNotFoundError:
+                pass
+            raise
+        with self._lock:
+            self._total += len(payload)
+            over = self._total > self.max_bytes
+        if over:
+            self.evict()
+        return path
+
+    def _entries(self):
+        """(mtime, size, path) of every entry; removes stale temporary files."""
+        entries = []
+        stale = time.time() - STALE_TEMP_SECONDS
+        for subdirectory in os.scandir(self.directory):
+            if not subdirectory.is_dir():
+                continue
+            for entry in os.scandir(subdirectory.path):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if entry.name.startswith(".tmp-"):
+                    if stat.st_mtime < stale:
+                        try:
+                            os.unlink(entry.path)
+                        except FileNotFoundError:
+                            pass
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def evict(self):
+        """Remove least recently used entries until the total is under 90% of max_bytes."""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        with self._lock:
+            self._total = total
+
+    def clear(self):
+        for _, _, path in self._entries():
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self._total = 0
+            self.hits = self.misses = 0
@@ -0,0 +1,391 @@
+"""Read rendered QR codes back, to check that they still scan.
+
+Usage:
+    python -m qr_decode code.png
+    python -m qr_decode code.png --expect "https://example.com"
+
+A logo pasted over the middle of a code hides the modules under it, and
+readers only get the payload back while error correction can repair
+them. This reader is meant for our own output, not for photos: the
+symbol is the bounding box of the dark pixels (the three finder patterns
+fix its corners) and each module is sampled at its center. The rest is a
+full decode: format information, unmasking, de-interleaving, Reed-Solomon
+correction and the data segments. Every block reports how many errors it
+needed corrected, and the worst block against its correction capacity is
+the margin left before the code stops scanning.
+"""
+import argparse
+import sys
+from collections import namedtuple
+
+import numpy as np
+from PIL import Image
+
+import qr_engine
+import qr_native
+import qr_segments
+
+MODE_STRUCTURED_APPEND = 0b0011
+MODE_ECI = 0b0111
+MODE_FNC1_FIRST = 0b0101
+MODE_FNC1_SECOND = 0b1001
+
+ALPHANUMERIC = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ $%*+-./:"
+LEVEL_NAMES = {constant: level for level, constant in qr_engine.EC_LEVELS.items()}
+
+# Format information words for every (error_correction, mask)
+FORMAT_CODES = {qr_native.format_bits(ec, mask): (ec, mask) for ec in range(4) for mask in range(8)}
+
+# Codewords the standard keeps for misdecode protection, so small symbols
+# correct fewer errors than half their EC codewords; keyed (version, error_correction)
+PROTECTION = {
+    (1, qr_engine.EC_LEVELS["L"]): 3, (1, qr_engine.EC_LEVELS["M"]): 2,
+    (1, qr_engine.EC_LEVELS["Q"]): 1, (1, qr_engine.EC_LEVELS["H"]): 1,
+    (2, qr_engine.EC_LEVELS["L"]): 2, (3, qr_engine.EC_LEVELS["L"]): 1,
+}
+
+_EXP = qr_native.GF_EXP.tolist()
+_LOG = qr_native.GF_LOG.tolist()
+
+
+class DecodeError(ValueError):
+    """The image holds no QR code this reader can get the data out of."""
+
+
+class Decoded(namedtuple("Decoded", "text version error_correction mask errors capacity structured")):
+    """A decoded symbol.
+
+    errors holds the errors corrected in each block, capacity how many a
+    block can correct, and structured the (index, total, parity) of a
+    structured append header, or None.
+    """
+
+    @property
+    def worst(self):
+        return max(self.errors)
+
+    @property
+    def margin(self):
+        """Share of the worst block's correction capacity still unused."""
+        return 1 - self.worst / self.capacity if self.capacity else 0.0
+
+
+Verification = namedtuple("Verification", "ok errors capacity margin reason")
+
+
+def _flatten(image):
+    """Luminance of image composited over white."""
+    if image.mode in ("1", "L"):
+        return np.asarray(image.convert("L"))
+    image = image.convert("RGBA")
+    luminance = np.asarray(image.convert("L"))
+    alpha = image.getchannel("A")
+    if alpha.getextrema() == (255, 255):
+        return luminance
+    alpha = np.asarray(alpha, dtype=np.uint16)
+    return ((luminance * alpha + 255 * (255 - alpha)) // 255).astype(np.uint8)
+
+
+def sample_modules(image):
+    """The module matrix (quiet zone stripped) of the code in a rendered image."""
+    luminance = _flatten(image)
+    low, high = int(luminance.min()), int(luminance.max())
+    if high - low < 32:
+        raise DecodeError("Image has no contrast")
+    dark = luminance < (low + high) // 2
+    rows = np.flatnonzero(dark.any(axis=1))
+    cols = np.flatnonzero(dark.any(axis=0))
+    top, bottom, left, right = rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+    width, height = right - left, bottom - top
+
+    # The top edge of the top-left finder pattern is 7 dark modules wide
+    edge = dark[top, left:right]
+    if not edge[0] or edge.all():
+        raise DecodeError("No finder pattern found")
+    module = np.argmin(edge) / 7
+    version = round((width / module - 17) / 4)
+    if not 1 <= version <= 40 or abs(width - height) > module:
+        raise DecodeError("No QR code found")
+    size = version * 4 + 17
+    centers = (np.arange(size) + 0.5) / size
+    return dark[np.ix_(top + (centers * height).astype(int), left + (centers * width).astype(int))]
+
+
+def _read_format(modules, layout):
+    weights = 1 << np.arange(15)
+    copies = (int(modules[layout.format_rows, 8] @ weights), int(modules[8, layout.format_cols] @ weights))
+    distance, code = min((bin(copy ^ code).count("1"), code) for code in FORMAT_CODES for copy in copies)
+    if distance > 3:
+        raise DecodeError("Format information unreadable")
+    return FORMAT_CODES[code]
+
+
+def _blocks(codewords, version, error_correction):
+    """De-interleave into a (blocks, long block length) array, short blocks front-padded with 0."""
+    total = len(codewords)
+    degree = qr_native.ECC_PER_BLOCK[error_correction][version - 1]
+    count = qr_native.NUM_BLOCKS[error_correction][version - 1]
+    short_blocks = count - total % count
+    short_length = total // count - degree
+    long_length = short_length + 1 if short_blocks < count else short_length
+    data_count = total - degree * count
+
+    # Undo add_error_correction: data column by column, short blocks
+    # skipping the last one, then the EC codewords the same way
+    present = np.ones((long_length, count), dtype=bool)
+    present[short_length:, :short_blocks] = False
+    data = np.zeros((long_length, count), dtype=np.uint8)
+    data[present] = codewords[:data_count]
+    data = data.T
+    data[:short_blocks] = np.roll(data[:short_blocks], long_length - short_length, axis=1)
+    ecc = codewords[data_count:].reshape(degree, count).T
+    return np.concatenate([data, ecc], axis=1), degree, short_blocks, long_length - short_length
+
+
+def _syndromes(blocks, count):
+    """Syndromes S_j = r(a^j), j < count, of every block; shape (blocks, count)."""
+    length = blocks.shape[1]
+    powers = np.arange(count)[:, None] * np.arange(length - 1, -1, -1)[None, :] % 255
+    logs = qr_native.GF_LOG[blocks]
+    terms = qr_native.GF_EXP[(logs[:, None, :] + powers[None]) % 255]
+    terms[np.broadcast_to((blocks == 0)[:, None, :], terms.shape)] = 0
+    return np.bitwise_xor.reduce(terms, axis=2)
+
+
+def _mul(a, b):
+    if a == 0 or b == 0:
+        return 0
+    return _EXP[_LOG[a] + _LOG[b]]
+
+
+def _div(a, b):
+    if a == 0:
+        return 0
+    return _EXP[(_LOG[a] - _LOG[b]) % 255]
+
+
+def _evaluate(poly, x):
+    """poly (lowest power first) at x."""
+    value = 0
+    for coefficient in reversed(poly):
+        value = _mul(value, x) ^ coefficient
+    return value
+
+
+def _error_locator(syndromes):
+    """Berlekamp-Massey: the error locator polynomial, lowest power first."""
+    locator = [1]
+    previous = [1]
+    length = 0
+    shift = 1
+    last = 1
+    for n, syndrome in enumerate(syndromes):
+        discrepancy = syndrome
+        for i in range(1, min(length, len(locator) - 1) + 1):
+            discrepancy ^= _mul(locator[i], syndromes[n - i])
+        if discrepancy == 0:
+            shift += 1
+            continue
+        factor = _div(discrepancy, last)
+        update = locator + [0] * max(0, len(previous) + shift - len(locator))
+        for i, coefficient in enumerate(previous):
+            update[i + shift] ^= _mul(factor, coefficient)
+        if 2 * length <= n:
+            previous, last, length, shift = locator, discrepancy, n + 1 - length, 1
+        else:
+            shift += 1
+        locator = update
+    return (locator + [0] * length)[:length + 1]
+
+
+def _correct(block, syndromes, padding):
+    """Correct block in place and return the number of errors, or None if it can't be."""
+    locator = _error_locator(syndromes)
+    errors = len(locator) - 1
+    if 2 * errors > len(syndromes):
+        return None
+    length = len(block)
+    # Chien search over the real codewords; position p is the power of x
+    positions = [p for p in range(length - padding) if _evaluate(locator, _EXP[(255 - p) % 255]) == 0]
+    if len(positions) != errors:
+        return None
+
+    # Forney, with the generator's first root at a^0
+    count = len(syndromes)
+    evaluator = [0] * count
+    for i, syndrome in enumerate(syndromes):
+        for j, coefficient in enumerate(locator[:count - i]):
+            evaluator[i + j] ^= _mul(syndrome, coefficient)
+    derivative = [coefficient if i % 2 else 0 for i, coefficient in enumerate(locator)][1:]
+    for p in positions:
+        inverse = _EXP[(255 - p) % 255]
+        denominator = _evaluate(derivative, inverse)
+        if denominator == 0:
+            return None
+        block[length - 1 - p] ^= _mul(_EXP[p], _div(_evaluate(evaluator, inverse), denominator))
+    return errors
+
+
+def _correct_blocks(blocks, degree, short_blocks, padding, capacity):
+    """Repair every block; return the data codewords and the errors per block."""
+    syndromes = _syndromes(blocks, degree)
+    errors = []
+    for index in range(len(blocks)):
+        if not syndromes[index].any():
+            errors.append(0)
+            continue
+        block = blocks[index].tolist()
+        count = _correct(block, syndromes[index].tolist(), padding if index < short_blocks else 0)
+        if count is None or count > capacity:
+            raise DecodeError(f"Too many errors in block {index + 1}")
+        blocks[index] = block
+        errors.append(count)
+    corrected = [index for index, count in enumerate(errors) if count]
+    if corrected and _syndromes(blocks[corrected], degree).any():
+        raise DecodeError("Error correction failed")
+    data = [row[padding if index < short_blocks else 0:-degree] for index, row in enumerate(blocks)]
+    return np.concatenate(data), errors
+
+
+class _BitReader:
+    def __init__(self, data):
+        self.bits = "".join(format(byte, "08b") for byte in data.tolist())
+        self.position = 0
+
+    def remaining(self):
+        return len(self.bits) - self.position
+
+    def read(self, count):
+        if count > self.remaining():
+            raise DecodeError("Data ends inside a segment")
+        value = int(self.bits[self.position:self.position + count] or "0", 2)
+        self.position += count
+        return value
+
+
+def _read_segments(data, version):
+    """Text and structured append header of the data codewords."""
+    reader = _BitReader(data)
+    payload = bytearray()
+    structured = None
+    while reader.remaining() >= 4:
+        mode = reader.read(4)
+        if mode == 0:
+            break
+        if mode == MODE_STRUCTURED_APPEND:
+            structured = (reader.read(4), reader.read(4) + 1, reader.read(8))
+            continue
+        if mode == MODE_ECI:
+            # Designator of 1 to 3 bytes; the payload is taken as UTF-8 regardless
+            first = reader.read(8)
+            reader.read(8 if first & 0xC0 == 0x80 else 16 if first & 0xE0 == 0xC0 else 0)
+            continue
+        if mode == MODE_FNC1_FIRST:
+            continue
+        if mode == MODE_FNC1_SECOND:
+            reader.read(8)
+            continue
+        if mode not in qr_segments.MODES:
+            raise DecodeError(f"Unknown mode {mode:04b}")
+        count = reader.read(qr_segments.count_bits(mode, version))
+        if mode == qr_segments.MODE_NUMBER:
+            for start in range(0, count, 3):
+                digits = min(3, count - start)
+                value = reader.read((0, 4, 7, 10)[digits])
+                if value >= 10 ** digits:
+                    raise DecodeError("Invalid numeric data")
+                payload += f"{value:0{digits}d}".encode("ascii")
+        elif mode == qr_segments.MODE_ALPHA_NUM:
+            for start in range(0, count, 2):
+                if count - start == 1:
+                    values = (reader.read(6),)
+                else:
+                    values = divmod(reader.read(11), 45)
+                if max(values) >= 45:
+                    raise DecodeError("Invalid alphanumeric data")
+                payload += "".join(ALPHANUMERIC[value] for value in values).encode("ascii")
+        elif mode == qr_segments.MODE_KANJI:
+            codes = bytearray()
+            for _ in range(count):
+                high, low = divmod(reader.read(13), 0xC0)
+                code = high << 8 | low
+                code += 0x8140 if code + 0x8140 <= 0x9FFC else 0xC140
+                codes += bytes((code >> 8, code & 0xFF))
+            payload += codes.decode("shift_jis", "replace").encode("utf-8")
+        else:
+            payload += bytes(reader.read(8) for _ in range(count))
+    try:
+        return payload.decode("utf-8"), structured
+    except UnicodeDecodeError:
+        return payload.decode("latin-1"), structured
+
+
+def decode_modules(modules):
+    """Decode a module matrix without quiet zone; raise DecodeError if it can't be read."""
+    modules = np.asarray(modules, dtype=bool)
+    size = len(modules)
+    version = (size - 17) // 4
+    if size != version * 4 + 17 or not 1 <= version <= 40:
+        raise DecodeError(f"{size} modules is no QR code size")
+    layout = qr_native.template(version)
+    error_correction, mask = _read_format(modules, layout)
+    bits = modules[layout.rows, layout.cols] ^ layout.masks[mask]
+    codewords = np.packbits(bits[:layout.codewords * 8])
+    blocks, degree, short_blocks, padding = _blocks(codewords, version, error_correction)
+    capacity = (degree - PROTECTION.get((version, error_correction), 0)) // 2
+    data, errors = _correct_blocks(blocks, degree, short_blocks, padding, capacity)
+    text, structured = _read_segments(data, version)
+    return Decoded(text, version, LEVEL_NAMES[error_correction], mask, errors, capacity, structured)
+
+
+def decode(image):
+    """Decode the QR code in a rendered PIL image."""
+    return decode_modules(sample_modules(image))
+
+
+def verify(image, expected):
+    """Check that image decodes to expected; return a Verification.
+
+    errors and capacity are those of the worst block (None when the code
+    can't be read at all) and margin the share of its capacity left.
+    """
+    try:
+        decoded = decode(image)
+    except DecodeError as e:
+        return Verification(False, None, None, 0.0, str(e))
+    if decoded.text != expected:
+        return Verification(False, decoded.worst, decoded.capacity, decoded.margin, "Decodes to different data")
+    return Verification(True, decoded.worst, decoded.capacity, decoded.margin, None)
+
+
+def describe(verification):
+    if not verification.ok:
+        return f"FAILED: {verification.reason}"
+    return (f"OK: {verification.errors} of {verification.capacity} correctable errors used in the worst block, "
+            f"{verification.margin:.0%} margin left")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="qr_decode", description="Decode a rendered QR code image.")
+    parser.add_argument("image", help="PNG, WebP or other raster image of one code")
+    parser.add_argument("--expect", help="payload the code should hold; exit with 1 if it doesn't")
+    args = parser.parse_args(argv)
+
+    with Image.open(args.image) as image:
+        if args.expect is not None:
+            verification = verify(image, args.expect)
+            print(describe(verification))
+            return 0 if verification.ok else 1
+        try:
+            decoded = decode(image)
+        except DecodeError as e:
+            print(f"FAILED: {e}")
+            return 1
+    print(decoded.text)
+    print(f"version {decoded.version}-{decoded.error_correction}, mask {decoded.mask}, "
+          f"errors per block {decoded.errors} of {decoded.capacity}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
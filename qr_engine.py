@@ -0,0 +1,253 @@
+"""Headless QR code rendering shared by the desktop app and the batch tools."""
+import hashlib
+
+import numpy as np
+import qrcode
+from PIL import Image, ImageColor
+from qrcode.exceptions import DataOverflowError  # Raised by encode() for data that doesn't fit
+
+import qr_native
+import qr_profile
+import qr_segments
+from qr_cache import LRUCache
+
+# Error correction levels as shown in the UI
+EC_LEVELS = {
+    "L": qrcode.constants.ERROR_CORRECT_L,
+    "M": qrcode.constants.ERROR_CORRECT_M,
+    "Q": qrcode.constants.ERROR_CORRECT_Q,
+    "H": qrcode.constants.ERROR_CORRECT_H,
+}
+
+# Fraction of the QR width covered by an embedded logo
+LOGO_SCALE = 0.2
+
+# Pixel size of the preview panel in the app
+PREVIEW_SIZE = 250
+
+# Longest side of the working copy kept for a logo. Large enough for a
+# 20% logo on a version 40 code at box_size 25.
+LOGO_WORKING_SIZE = 1024
+
+# Matrix encoders for encode(): the NumPy one in qr_native, or the qrcode
+# package it is checked against (python -m qr_native --check)
+ENCODERS = ("native", "qrcode")
+encoder = "native"
+
+# Encoded module matrices keyed by (data, error_correction, border). Colors,
+# logos and box size don't change the matrix, so restyling skips encoding.
+matrix_cache = LRUCache(256)
+
+# Rendered images keyed by the matrix key plus everything that affects pixels
+image_cache = LRUCache(16)
+
+try:
+    RESAMPLE_MODE = Image.Resampling.LANCZOS
+except AttributeError:
+    RESAMPLE_MODE = getattr(Image, "LANCZOS", Image.BICUBIC)
+
+
+def ec_level(level):
+    """Normalize an error correction level to 'L', 'M', 'Q' or 'H'.
+
+    Any case is accepted; anything else raises ValueError.
+    """
+    name = str(level).upper()
+    if name not in EC_LEVELS:
+        raise ValueError(f"Unknown error correction level: {level!r} (expected L, M, Q or H)")
+    return name
+
+
+def error_correction_for(level):
+    """Map an 'L'/'M'/'Q'/'H' level (any case) to the qrcode constant."""
+    return EC_LEVELS[ec_level(level)]
+
+
+def set_encoder(name):
+    """Choose the matrix encoder used by encode(). Both give identical matrices."""
+    global encoder
+    if name not in ENCODERS:
+        raise ValueError(f"Unknown encoder: {name}")
+    encoder = name
+
+
+class PreparedLogo:
+    """A logo normalized once for repeated compositing.
+
+    The source is downscaled to LOGO_WORKING_SIZE and kept with premultiplied
+    alpha, so later resizes are cheap and don't bleed the color of fully
+    transparent pixels into the edges. The resized tile for each QR pixel
+    size is cached.
+    """
+
+    def __init__(self, image, working_size=LOGO_WORKING_SIZE):
+        image = image.convert("RGBA").convert("RGBa")
+        if max(image.size) > working_size:
+            image.thumbnail((working_size, working_size), RESAMPLE_MODE)
+        self.image = image
+        self.size = image.size
+        self.digest = hashlib.sha1(image.tobytes()).hexdigest()
+        self._tiles = LRUCache(8)
+
+    @classmethod
+    def open(cls, path, working_size=LOGO_WORKING_SIZE):
+        with Image.open(path) as img:
+            # Let JPEG decode straight at a reduced scale
+            img.draft("RGB", (working_size, working_size))
+            return cls(img, working_size)
+
+    def tile(self, qr_size, scale=LOGO_SCALE):
+        """Return the RGBA logo tile for a QR image qr_size pixels wide."""
+        return self._tiles.get_or_create((qr_size, scale), lambda: self._make_tile(int(qr_size * scale)))
+
+    def _make_tile(self, logo_size):
+        # Same fit as Image.thumbnail: keep the aspect ratio, never upscale
+        width, height = self.size
+        ratio = min(logo_size / width, logo_size / height, 1.0)
+        size = (max(1, round(width * ratio)), max(1, round(height * ratio)))
+        tile = self.image if size == self.size else self.image.resize(size, RESAMPLE_MODE)
+        return tile.convert("RGBA")
+
+
+def load_logo(path):
+    """Open and normalize a logo image from disk."""
+    return PreparedLogo.open(path)
+
+
+def color_rgba(color):
+    """Resolve a PIL color name, hex string or tuple to an opaque RGBA tuple."""
+    if isinstance(color, str):
+        if color.lower() == "transparent":
+            return (0, 0, 0, 0)
+        color = ImageColor.getrgb(color)
+    return tuple(color[:3]) + (255,)
+
+
+def make_qr(data, error_correction="L", box_size=10, border=2):
+    """Encode data into a qrcode.QRCode object of the smallest version.
+
+    The version and the mode segments come from qr_segments in one pass
+    rather than from qrcode's fit loop.
+    """
+    if not data:
+        raise ValueError("No data to encode")
+    error_correction = error_correction_for(error_correction)
+    version, segments = qr_segments.plan(data, error_correction)
+    qr = qrcode.QRCode(
+        version=version,
+        error_correction=error_correction,
+        box_size=box_size,
+        border=border,
+    )
+    for segment in segments:
+        qr.add_data(segment)
+    qr.make(fit=False)
+    return qr
+
+
+def embed_logo(qr_img, logo, scale=LOGO_SCALE):
+    """Composite the logo in the middle of the QR image and return it."""
+    if logo is None:
+        return qr_img
+    with qr_profile.stage("embed_logo"):
+        if not isinstance(logo, PreparedLogo):
+            logo = PreparedLogo(logo)
+        qr_width, qr_height = qr_img.size
+        tile = logo.tile(qr_width, scale)
+        pos = ((qr_width - tile.size[0]) // 2, (qr_height - tile.size[1]) // 2)
+        qr_img.alpha_composite(tile, pos)
+        return qr_img
+
+
+def encode(data, error_correction="L", border=2):
+    """Encode data and return (modules, version), using matrix_cache.
+
+    modules is a read-only square boolean array including the quiet zone,
+    True for dark modules.
+    """
+    error_correction = ec_level(error_correction)
+    key = (data, error_correction, border)
+    cached = matrix_cache.get(key)
+    if cached is None:
+        with qr_profile.stage("encode"):
+            if encoder == "native":
+                modules, version = qr_native.encode(data, error_correction_for(error_correction), border)
+            else:
+                qr = make_qr(data, error_correction, border=border)
+                modules, version = np.array(qr.get_matrix(), dtype=bool), qr.version
+        modules.flags.writeable = False
+        cached = (modules, version)
+        matrix_cache.put(key, cached)
+    return cached
+
+
+def rasterize(modules, box_size=10, fill_color="black", back_color="white"):
+    """Build the RGBA image for a module matrix in one pass.
+
+    Each module is mapped to its packed RGBA color and the small color grid
+    is then scaled up by box_size, instead of drawing every dark module as
+    its own rectangle and converting the bitmap afterwards.
+    """
+    with qr_profile.stage("rasterize"):
+        palette = np.array([color_rgba(back_color), color_rgba(fill_color)], dtype=np.uint8).view(np.uint32)
+        pixels = palette[np.asarray(modules, dtype=np.uint8)].reshape(len(modules), -1)
+        if box_size > 1:
+            pixels = pixels.repeat(box_size, axis=0).repeat(box_size, axis=1)
+        height, width = pixels.shape
+        return Image.frombuffer("RGBA", (width, height), pixels, "raw", "RGBA", 0, 1)
+
+
+def render_qr(data, error_correction="L", fill_color="black", back_color="white",
+              logo=None, box_size=10, border=2):
+    """Render data to an RGBA PIL image, with the logo embedded if given.
+
+    Results come from image_cache and are shared, so callers must copy the
+    image before drawing on it.
+    """
+    if logo is not None and not isinstance(logo, PreparedLogo):
+        logo = PreparedLogo(logo)
+    key = (data, error_correction, border, box_size, fill_color, back_color, logo and logo.digest)
+    image = image_cache.get(key)
+    if image is None:
+        modules, _ = encode(data, error_correction, border)
+        image = embed_logo(rasterize(modules, box_size, fill_color, back_color), logo)
+        image_cache.put(key, image)
+    return image
+
+
+def render_preview(data, size=PREVIEW_SIZE, **options):
+    """Render data at no more than size pixels for on-screen preview.
+
+    Each module gets a whole number of pixels (nearest neighbor), so the
+    cost depends on the preview size rather than the export box_size.
+    """
+    options.pop("box_size", None)
+    modules, _ = encode(data, options.get("error_correction", "L"), options.get("border", 2))
+    return render_qr(data, box_size=max(1, size // len(modules)), **options)
+
+
+def preview_mask(data, size=PREVIEW_SIZE, error_correction="L", border=2):
+    """The code as a "P" image of at most size pixels: index 1 on dark modules, 0 elsewhere.
+
+    No palette is set. A caller colors its own copy with putpalette, so
+    a color change is a palette swap rather than a new render. Cached in
+    image_cache.
+    """
+    modules, _ = encode(data, error_correction, border)
+    box_size = max(1, size // len(modules))
+    key = ("mask", data, error_correction, border, box_size)
+    mask = image_cache.get(key)
+    if mask is None:
+        with qr_profile.stage("rasterize"):
+            pixels = np.asarray(modules, dtype=np.uint8)
+            if box_size > 1:
+                pixels = pixels.repeat(box_size, axis=0).repeat(box_size, axis=1)
+            mask = Image.frombytes("P", pixels.shape[::-1], pixels.tobytes())
+        image_cache.put(key, mask)
+    return mask
+
+
+def render_qr_bytes(data, format="PNG", **options):
+    """Render data and return the encoded file bytes (PNG, WebP, SVG or PDF)."""
+    import qr_export  # qr_export imports this module
+    return qr_export.export_qr(data, format, **options).data
@@ -0,0 +1,142 @@
+"""Output encoding for finished QR codes.
+
+Raster codes only ever contain the two module colors plus, with a logo,
+the logo's own pixels. Instead of saving a 4-channel RGBA image, PNGs are
+written as palette images straight from the module matrix: two colors
+(1 bit per pixel) without a logo, or the two module colors plus a small
+quantized palette for the logo area. WebP is written lossless.
+"""
+import hashlib
+import io
+import json
+import time
+from collections import namedtuple
+
+import numpy as np
+from PIL import Image
+
+import qr_engine
+import qr_profile
+import qr_vector
+
+RASTER_FORMATS = ("PNG", "WEBP")
+VECTOR_FORMATS = ("SVG", "PDF")
+
+# Palette entries available to a logo, on top of the two module colors.
+# 16 entries in total lets PNG store 4 bits per pixel.
+LOGO_COLORS = 14
+
+try:
+    FASTOCTREE = Image.Quantize.FASTOCTREE
+except AttributeError:
+    FASTOCTREE = Image.FASTOCTREE
+
+ExportResult = namedtuple("ExportResult", "data format nbytes seconds")
+
+# Part of every export_key; bump it when export_qr writes different bytes
+# for the same inputs, so disk caches don't serve the old output. 2: lowercase
+# levels were rendered as L but keyed as their uppercase level. 3: logo palettes
+# trimmed to the colors in use.
+EXPORT_VERSION = 3
+
+
+def matrix_palette_image(modules, fill_color="black", back_color="white", logo=None, box_size=10,
+                         logo_colors=LOGO_COLORS):
+    """Render a module matrix (quiet zone included) as a "P" image with only the colors used."""
+    indices = np.asarray(modules, dtype=np.uint8).repeat(box_size, axis=0).repeat(box_size, axis=1)
+    palette = [qr_engine.color_rgba(back_color), qr_engine.color_rgba(fill_color)]
+
+    if logo is not None:
+        if not isinstance(logo, qr_engine.PreparedLogo):
+            logo = qr_engine.PreparedLogo(logo)
+        size = indices.shape[0]
+        tile = logo.tile(size)
+        x, y = (size - tile.size[0]) // 2, (size - tile.size[1]) // 2
+        box = (x, y, x + tile.size[0], y + tile.size[1])
+        # Only the logo area needs quantizing; the rest keeps the exact module colors
+        top, left = y // box_size, x // box_size
+        bottom, right = -(-box[3] // box_size), -(-box[2] // box_size)
+        region = qr_engine.rasterize(modules[top:bottom, left:right], box_size, fill_color, back_color)
+        dx, dy = x - left * box_size, y - top * box_size
+        region.alpha_composite(tile, (dx, dy))
+        region = region.crop((dx, dy, dx + tile.size[0], dy + tile.size[1])).quantize(logo_colors, method=FASTOCTREE)
+        # FASTOCTREE pads the palette with unused transparent entries; keep only
+        # the colors in use, or every opaque logo would get an RGBA palette
+        region_indices = np.asarray(region, dtype=np.uint8)
+        used = np.unique(region_indices)
+        region_palette = region.getpalette("RGBA")
+        palette += [tuple(region_palette[4 * i:4 * i + 4]) for i in used]
+        remap = np.zeros(256, dtype=np.uint8)
+        remap[used] = np.arange(2, len(used) + 2)
+        indices = indices.copy()
+        indices[y:box[3], x:box[2]] = remap[region_indices]
+
+    height, width = indices.shape
+    image = Image.frombytes("P", (width, height), indices.tobytes())
+    if all(color[3] == 255 for color in palette):
+        image.putpalette(bytes(channel for color in palette for channel in color[:3]))
+    else:
+        image.putpalette(bytes(channel for color in palette for channel in color), rawmode="RGBA")
+    return image
+
+
+def encode_raster(image, format="PNG", compress_level=6, optimize=False):
+    """Encode a PIL image as PNG or lossless WebP and return the bytes."""
+    buffer = io.BytesIO()
+    if format == "WEBP":
+        if image.mode == "P":
+            # Alpha lives in an RGBA palette or in the transparency entry
+            alpha = image.palette.mode == "RGBA" or "transparency" in image.info
+            image = image.convert("RGBA" if alpha else "RGB")
+        # method trades encode time for size like the zlib level does for PNG
+        image.save(buffer, format="WEBP", lossless=True, quality=100, method=round(compress_level * 6 / 9))
+    else:
+        image.save(buffer, format=format, compress_level=compress_level, optimize=optimize)
+    return buffer.getvalue()
+
+
+def export_qr(data, format="PNG", compress_level=6, optimize=False, logo_colors=LOGO_COLORS, **options):
+    """Render and encode data, returning an ExportResult with size and timing.
+
+    options are the render_qr keyword arguments. seconds covers building
+    the output image and encoding it, not the cached matrix encode.
+    """
+    error_correction = options.pop("error_correction", "L")
+    border = options.pop("border", 2)
+    modules, _ = qr_engine.encode(data, error_correction, border)
+    return export_modules(modules, format, compress_level, optimize, logo_colors, **options)
+
+
+def export_key(data, logo_digest=None, format="PNG", compress_level=6, optimize=False, logo_colors=LOGO_COLORS,
+               error_correction="L", fill_color="black", back_color="white", box_size=10, border=2):
+    """Content address of export_qr's output: a SHA-256 over every input.
+
+    The logo goes in by its PreparedLogo digest and colors as RGBA, so
+    "black" and "#000000" share an entry.
+    """
+    inputs = [
+        EXPORT_VERSION, data, format.upper(), compress_level, bool(optimize), logo_colors,
+        qr_engine.ec_level(error_correction), qr_engine.color_rgba(fill_color), qr_engine.color_rgba(back_color),
+        box_size, border, logo_digest,
+    ]
+    return hashlib.sha256(json.dumps(inputs, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def export_modules(modules, format="PNG", compress_level=6, optimize=False, logo_colors=LOGO_COLORS,
+                   fill_color="black", back_color="white", logo=None, box_size=10):
+    """export_qr for an already encoded module matrix (quiet zone included)."""
+    format = format.upper()
+    if format not in RASTER_FORMATS + VECTOR_FORMATS:
+        raise ValueError(f"Unsupported format: {format}")
+    if logo is not None and not isinstance(logo, qr_engine.PreparedLogo):
+        logo = qr_engine.PreparedLogo(logo)
+    start = time.perf_counter()
+    if format in VECTOR_FORMATS:
+        with qr_profile.stage("vector"):
+            payload = qr_vector.VECTOR_FORMATS[format](modules, box_size, fill_color, back_color, logo)
+    else:
+        with qr_profile.stage("palette"):
+            image = matrix_palette_image(modules, fill_color, back_color, logo, box_size, logo_colors)
+        with qr_profile.stage("encode_file"):
+            payload = encode_raster(image, format, compress_level, optimize)
+    return ExportResult(payload, format, len(payload), time.perf_counter() - start)
@@ -0,0 +1,492 @@
+"""QR matrix encoder written with NumPy, bit-identical to the qrcode package.
+
+Usage:
+    python -m qr_native --check
+    python -m qr_native --check 2000
+
+qrcode spends most of its time in pure-Python loops: polynomial division
+for the Reed-Solomon codewords, placing the data bit by bit, and scoring
+each of the 8 masks cell by cell. Here the GF(256) log/antilog tables and
+a multiplication table per generator polynomial are built once, the
+function patterns and the zigzag order of the data cells are cached per
+version, and the 8 masked candidates are scored together with array
+operations.
+
+The mask choice follows qrcode exactly, including its quirk of scoring
+candidates with the format bits, version bits and dark module all light.
+--check encodes random payloads both ways and compares the matrices.
+"""
+import argparse
+import random
+import string
+import sys
+import time
+
+import numpy as np
+from qrcode import exceptions
+
+import qr_segments
+from qr_cache import LRUCache
+
+# Error correction codewords per block and number of blocks, indexed
+# [error_correction][version - 1] by the qrcode ERROR_CORRECT_* constant
+# (M=0, L=1, H=2, Q=3)
+ECC_PER_BLOCK = (
+    (10, 16, 26, 18, 24, 16, 18, 22, 22, 26, 30, 22, 22, 24, 24, 28, 28, 26, 26, 26,
+     26, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28),
+    (7, 10, 15, 20, 26, 18, 20, 24, 30, 18, 20, 24, 26, 30, 22, 24, 28, 30, 28, 28,
+     28, 28, 30, 30, 26, 28, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30),
+    (17, 28, 22, 16, 22, 28, 26, 26, 24, 28, 24, 28, 22, 24, 24, 30, 28, 28, 26, 28,
+     30, 24, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30),
+    (13, 22, 18, 26, 18, 24, 18, 22, 20, 24, 28, 26, 24, 20, 30, 24, 28, 28, 26, 30,
+     28, 30, 30, 30, 30, 28, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30),
+)
+NUM_BLOCKS = (
+    (1, 1, 1, 2, 2, 4, 4, 4, 5, 5, 5, 8, 9, 9, 10, 10, 11, 13, 14, 16,
+     17, 17, 18, 20, 21, 23, 25, 26, 28, 29, 31, 33, 35, 37, 38, 40, 43, 45, 47, 49),
+    (1, 1, 1, 1, 1, 2, 2, 2, 2, 4, 4, 4, 4, 4, 6, 6, 6, 6, 7, 8,
+     8, 9, 9, 10, 12, 12, 12, 13, 14, 15, 16, 17, 18, 19, 19, 20, 21, 22, 24, 25),
+    (1, 1, 2, 4, 4, 4, 5, 6, 8, 8, 11, 11, 16, 16, 18, 16, 19, 21, 25, 25,
+     25, 34, 30, 32, 35, 37, 40, 42, 45, 48, 51, 54, 57, 60, 63, 66, 70, 74, 77, 81),
+    (1, 1, 2, 2, 4, 4, 6, 6, 8, 8, 8, 10, 12, 16, 12, 17, 16, 18, 21, 20,
+     23, 23, 25, 27, 29, 34, 34, 35, 38, 40, 43, 45, 48, 51, 53, 56, 59, 62, 65, 68),
+)
+
+PAD_BYTES = (0xEC, 0x11)
+
+
+def _gf_tables():
+    exp = np.zeros(512, dtype=np.int32)
+    log = np.zeros(256, dtype=np.int32)
+    value = 1
+    for power in range(255):
+        exp[power] = value
+        log[value] = power
+        value <<= 1
+        if value & 0x100:
+            value ^= 0x11D
+    exp[255:510] = exp[:255]
+    return exp, log
+
+
+# Antilog table doubled so exponents can be added without a modulo
+GF_EXP, GF_LOG = _gf_tables()
+
+
+def generator_poly(degree):
+    """Coefficients of prod(x - a^i) for i < degree, highest power first."""
+    poly = [1]
+    for i in range(degree):
+        poly = poly + [0]
+        for j in range(len(poly) - 1, 0, -1):
+            if poly[j - 1]:
+                poly[j] ^= int(GF_EXP[GF_LOG[poly[j - 1]] + i])
+    return poly
+
+
+def _multiplication_table(degree):
+    # Row f holds f * g[1:], the feedback added to the remainder for a leading factor f
+    coefficients = np.array(generator_poly(degree)[1:], dtype=np.int32)
+    table = GF_EXP[GF_LOG[np.arange(256)][:, None] + GF_LOG[coefficients][None, :]]
+    table[0] = 0
+    table[:, coefficients == 0] = 0
+    return table.astype(np.uint8)
+
+
+# Remainder feedback tables for every ECC block size in use
+RS_TABLES = {degree: _multiplication_table(degree) for degree in sorted(set(sum(ECC_PER_BLOCK, ())))}
+
+
+def alignment_positions(version):
+    """Row/column centers of the alignment patterns."""
+    if version == 1:
+        return []
+    count = version // 7 + 2
+    size = version * 4 + 17
+    step = 26 if version == 32 else (version * 4 + count * 2 + 1) // (count * 2 - 2) * 2
+    return [6] + sorted(size - 7 - i * step for i in range(count - 1))
+
+
+def format_bits(error_correction, mask):
+    """The 15 format information bits, BCH code and mask pattern applied."""
+    data = error_correction << 3 | mask
+    remainder = data
+    for _ in range(10):
+        remainder = (remainder << 1) ^ ((remainder >> 9) * 0x537)
+    return (data << 10 | remainder) ^ 0x5412
+
+
+def version_bits(version):
+    """The 18 version information bits (versions 7 and up)."""
+    remainder = version
+    for _ in range(12):
+        remainder = (remainder << 1) ^ ((remainder >> 11) * 0x1F25)
+    return version << 12 | remainder
+
+
+def _bit_array(value, count):
+    """Bits of value, least significant first."""
+    return (value >> np.arange(count)) & 1 == 1
+
+
+class Template:
+    """Everything about a version that doesn't depend on the data."""
+
+    def __init__(self, version):
+        self.version = version
+        size = self.size = version * 4 + 17
+        modules = np.zeros((size, size), dtype=bool)
+        reserved = np.zeros((size, size), dtype=bool)
+
+        # Finder patterns with their separators
+        finder = np.zeros((9, 9), dtype=bool)
+        finder[1:8, 1:8] = True
+        finder[2:7, 2:7] = False
+        finder[3:6, 3:6] = True
+        for row, col in ((0, 0), (size - 7, 0), (0, size - 7)):
+            top, left = max(row - 1, 0), max(col - 1, 0)
+            bottom, right = min(row + 8, size), min(col + 8, size)
+            modules[top:bottom, left:right] = finder[top - row + 1:bottom - row + 1, left - col + 1:right - col + 1]
+            reserved[top:bottom, left:right] = True
+
+        # Alignment patterns, skipped where the center is already taken
+        alignment = np.ones((5, 5), dtype=bool)
+        alignment[1:4, 1:4] = False
+        alignment[2, 2] = True
+        positions = alignment_positions(version)
+        for row in positions:
+            for col in positions:
+                if not reserved[row, col]:
+                    modules[row - 2:row + 3, col - 2:col + 3] = alignment
+                    reserved[row - 2:row + 3, col - 2:col + 3] = True
+
+        # Timing patterns, where nothing else is
+        timing = np.arange(8, size - 8)
+        free = ~reserved[timing, 6]
+        modules[timing[free], 6] = timing[free] % 2 == 0
+        free = ~reserved[6, timing]
+        modules[6, timing[free]] = timing[free] % 2 == 0
+        reserved[timing, 6] = True
+        reserved[6, timing] = True
+
+        # Format information, bit i at (rows[i], 8) and (8, cols[i])
+        i = np.arange(15)
+        self.format_rows = np.where(i < 6, i, np.where(i < 8, i + 1, size - 15 + i))
+        self.format_cols = np.where(i < 8, size - i - 1, np.where(i < 9, 15 - i, 14 - i))
+        reserved[self.format_rows, 8] = True
+        reserved[8, self.format_cols] = True
+        reserved[size - 8, 8] = True
+
+        # Version information, bit i at (i // 3, size - 11 + i % 3) and transposed
+        if version >= 7:
+            i = np.arange(18)
+            self.version_index = (i // 3, size - 11 + i % 3)
+            self.version_bits = _bit_array(version_bits(version), 18)
+            reserved[self.version_index] = True
+            reserved[self.version_index[::-1]] = True
+
+        self.modules = modules
+        self.rows, self.cols = self._data_cells(reserved)
+        self.codewords = len(self.rows) // 8
+        self.masks = np.stack([self._mask(pattern) for pattern in range(8)])
+
+    def _data_cells(self, reserved):
+        """Coordinates of the data cells in placement order (the zigzag)."""
+        size = self.size
+        rows = []
+        cols = []
+        upward = True
+        for right in range(size - 1, 0, -2):
+            if right <= 6:
+                right -= 1
+            for row in (range(size - 1, -1, -1) if upward else range(size)):
+                for col in (right, right - 1):
+                    if not reserved[row, col]:
+                        rows.append(row)
+                        cols.append(col)
+            upward = not upward
+        return np.array(rows), np.array(cols)
+
+    def _mask(self, pattern):
+        i, j = self.rows, self.cols
+        if pattern == 0:
+            return (i + j) % 2 == 0
+        if pattern == 1:
+            return i % 2 == 0
+        if pattern == 2:
+            return j % 3 == 0
+        if pattern == 3:
+            return (i + j) % 3 == 0
+        if pattern == 4:
+            return (i // 2 + j // 3) % 2 == 0
+        if pattern == 5:
+            return (i * j) % 2 + (i * j) % 3 == 0
+        if pattern == 6:
+            return ((i * j) % 2 + (i * j) % 3) % 2 == 0
+        return ((i * j) % 3 + (i + j) % 2) % 2 == 0
+
+    def finish(self, modules, error_correction, mask):
+        """Write the format and version information and the dark module."""
+        bits = _bit_array(format_bits(error_correction, mask), 15)
+        modules[self.format_rows, 8] = bits
+        modules[8, self.format_cols] = bits
+        modules[self.size - 8, 8] = True
+        if self.version >= 7:
+            modules[self.version_index] = self.version_bits
+            modules[self.version_index[::-1]] = self.version_bits
+        return modules
+
+
+templates = LRUCache(40)
+
+
+def template(version):
+    return templates.get_or_create(version, lambda: Template(version))
+
+
+_ALPHANUMERIC_VALUES = np.zeros(256, dtype=np.int64)
+_ALPHANUMERIC_VALUES[np.frombuffer(b"0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ $%*+-./:", dtype=np.uint8)] = np.arange(45)
+
+
+def _segment_fields(segment, version):
+    """(values, widths) of the bit fields that encode a segment, header included."""
+    mode = segment.mode
+    codes = np.frombuffer(segment.data, dtype=np.uint8).astype(np.int64)
+    if mode == qr_segments.MODE_NUMBER:
+        digits = codes - 48
+        full = len(digits) // 3 * 3
+        values = [digits[:full].reshape(-1, 3) @ np.array([100, 10, 1])]
+        widths = [np.full(full // 3, 10)]
+        if len(digits) > full:
+            values.append([int("".join(map(str, digits[full:])))])
+            widths.append([(0, 4, 7)[len(digits) - full]])
+    elif mode == qr_segments.MODE_ALPHA_NUM:
+        codes = _ALPHANUMERIC_VALUES[codes]
+        full = len(codes) // 2 * 2
+        values = [codes[:full].reshape(-1, 2) @ np.array([45, 1])]
+        widths = [np.full(full // 2, 11)]
+        if len(codes) > full:
+            values.append(codes[full:])
+            widths.append([6])
+    elif mode == qr_segments.MODE_KANJI:
+        pairs = codes[0::2] << 8 | codes[1::2]
+        pairs -= np.where(pairs <= 0x9FFC, 0x8140, 0xC140)
+        values = [(pairs >> 8) * 0xC0 + (pairs & 0xFF)]
+        widths = [np.full(len(pairs), 13)]
+    else:
+        values = [codes]
+        widths = [np.full(len(codes), 8)]
+    header = [[mode, len(segment)], [4, qr_segments.count_bits(mode, version)]]
+    return (np.concatenate([header[0]] + values).astype(np.int64),
+            np.concatenate([header[1]] + widths).astype(np.int64))
+
+
+def _bits(values, widths):
+    """Concatenate values as big-endian bit fields of the given widths (16 at most)."""
+    shifts = widths[:, None] - 1 - np.arange(16)
+    bits = (values[:, None] >> np.maximum(shifts, 0)) & 1
+    return bits[shifts >= 0].astype(np.uint8)
+
+
+def data_codewords(segments, version, error_correction, header=None):
+    """The data codewords for segments: terminator, byte padding and pad bytes included.
+
+    header is an optional (values, widths) pair of bit fields written before
+    the segments, such as a structured append header.
+    """
+    capacity = template(version).codewords - ECC_PER_BLOCK[error_correction][version - 1] * \
+        NUM_BLOCKS[error_correction][version - 1]
+    fields = [_segment_fields(segment, version) for segment in segments]
+    if header is not None:
+        fields.insert(0, (np.asarray(header[0], dtype=np.int64), np.asarray(header[1], dtype=np.int64)))
+    if fields:
+        bits = _bits(np.concatenate([f[0] for f in fields]), np.concatenate([f[1] for f in fields]))
+    else:
+        bits = np.zeros(0, dtype=np.uint8)
+    if len(bits) > capacity * 8:
+        raise exceptions.DataOverflowError(
+            f"Code length overflow. Data size ({len(bits)}) > size available ({capacity * 8})"
+        )
+    # Terminator of up to four zero bits, then zeros to the byte boundary
+    used = -(-min(len(bits) + 4, capacity * 8) // 8)
+    padded = np.zeros(used * 8, dtype=np.uint8)
+    padded[:len(bits)] = bits
+    codewords = np.empty(capacity, dtype=np.uint8)
+    codewords[:used] = np.packbits(padded)
+    codewords[used:] = np.resize(PAD_BYTES, capacity - used)
+    return codewords
+
+
+def add_error_correction(data, version, error_correction):
+    """Split data into blocks, append Reed-Solomon codewords and interleave."""
+    total = template(version).codewords
+    degree = ECC_PER_BLOCK[error_correction][version - 1]
+    blocks = NUM_BLOCKS[error_correction][version - 1]
+    short_blocks = blocks - total % blocks
+    short_length = total // blocks - degree
+    long_length = short_length + 1 if short_blocks < blocks else short_length
+
+    # Short blocks get a leading zero, which leaves their remainder unchanged,
+    # so every block runs through the shift register in lockstep
+    split = short_blocks * short_length
+    aligned = np.zeros((blocks, long_length), dtype=np.uint8)
+    aligned[:short_blocks, long_length - short_length:] = data[:split].reshape(short_blocks, short_length)
+    aligned[short_blocks:] = data[split:].reshape(blocks - short_blocks, long_length)
+
+    table = RS_TABLES[degree]
+    remainder = np.zeros((blocks, degree), dtype=np.uint8)
+    for column in aligned.T:
+        factor = column ^ remainder[:, 0]
+        remainder[:, :-1] = remainder[:, 1:]
+        remainder[:, -1] = 0
+        remainder ^= table[factor]
+
+    # Interleave column by column; the short blocks have no last data codeword
+    interleaved = np.full((long_length, blocks), -1, dtype=np.int16)
+    interleaved[:short_length, :short_blocks] = aligned[:short_blocks, long_length - short_length:].T
+    interleaved[:, short_blocks:] = aligned[short_blocks:].T
+    interleaved = interleaved.ravel()
+    return np.concatenate([interleaved[interleaved >= 0].astype(np.uint8), remainder.T.ravel()])
+
+
+def _run_penalty(candidates):
+    """Rule 1 along the last axis: runs of 5+ same-colored modules score length - 2."""
+    count, size = candidates.shape[0], candidates.shape[-1]
+    # Run boundaries, one row of size + 1 slots per line, so a run's length is
+    # the distance to the next boundary and lines never join up
+    edges = np.ones(candidates.shape[:-1] + (size + 1,), dtype=bool)
+    edges[..., 1:size] = candidates[..., 1:] != candidates[..., :-1]
+    positions = np.flatnonzero(edges)
+    lengths = np.diff(positions)
+    owners = positions[:-1] // (size * (size + 1))
+    return np.bincount(owners, np.where(lengths >= 5, lengths - 2, 0), minlength=count)
+
+
+def _finder_penalty(candidates):
+    """Rule 3 along the last axis: 1011101 with four light modules on one side."""
+    size = candidates.shape[-1]
+    windows = np.zeros(candidates.shape[:-1] + (size - 10,), dtype=np.uint16)
+    for offset in range(11):
+        windows <<= 1
+        windows |= candidates[..., offset:offset + size - 10]
+    found = (windows == 0b10111010000) | (windows == 0b00001011101)
+    return found.sum(axis=(1, 2)) * 40
+
+
+def penalty_scores(candidates):
+    """qrcode's lost_point for a stack of matrices, shape (masks, size, size)."""
+    candidates = np.ascontiguousarray(candidates, dtype=bool)
+    transposed = np.ascontiguousarray(candidates.transpose(0, 2, 1))
+    scores = _run_penalty(candidates) + _run_penalty(transposed)
+
+    top, bottom = candidates[:, :-1], candidates[:, 1:]
+    same = (top[..., :-1] == top[..., 1:]) & (top[..., :-1] == bottom[..., :-1]) & (bottom[..., :-1] == bottom[..., 1:])
+    scores += same.sum(axis=(1, 2)) * 3
+
+    scores += _finder_penalty(candidates) + _finder_penalty(transposed)
+
+    cells = candidates.shape[1] ** 2
+    for index, dark in enumerate(candidates.sum(axis=(1, 2)).tolist()):
+        # Same float arithmetic as qrcode, so rounding at the 5% steps agrees
+        scores[index] += int(abs(float(dark) / cells * 100 - 50) / 5) * 10
+    return scores.astype(np.int64)
+
+
+def encode_segments(segments, version, error_correction, mask=None, header=None):
+    """Return the module matrix (no quiet zone) for segments at a fixed version."""
+    layout = template(version)
+    data = data_codewords(segments, version, error_correction, header)
+    codewords = add_error_correction(data, version, error_correction)
+    bits = np.zeros(len(layout.rows), dtype=bool)
+    bits[:len(codewords) * 8] = np.unpackbits(codewords)
+
+    if mask is None:
+        # Score every mask with the function pattern area as qrcode sees it
+        # while testing: format bits, version bits and dark module all light
+        candidates = np.repeat(layout.modules[None], 8, axis=0)
+        candidates[:, layout.rows, layout.cols] = bits ^ layout.masks
+        mask = int(np.argmin(penalty_scores(candidates)))
+        modules = candidates[mask]
+    else:
+        modules = layout.modules.copy()
+        modules[layout.rows, layout.cols] = bits ^ layout.masks[mask]
+    return layout.finish(modules, error_correction, mask)
+
+
+def encode(data, error_correction, border=2):
+    """Encode text and return (modules, version) like qr_engine.encode.
+
+    error_correction is a qrcode ERROR_CORRECT_* constant. modules includes
+    a quiet zone border modules wide.
+    """
+    if not data:
+        raise ValueError("No data to encode")
+    version, segments = qr_segments.plan(data, error_correction)
+    modules = encode_segments(segments, version, error_correction)
+    if border:
+        modules = np.pad(modules, border)
+    return modules, version
+
+
+def random_payload(rng):
+    """Text mixing digits, alphanumerics, ASCII, accented letters and kanji."""
+    pieces = []
+    for _ in range(rng.randint(1, 12)):
+        kind = rng.randrange(5)
+        length = rng.choice((1, 3, 8, 25, 120))
+        if kind == 0:
+            alphabet = string.digits
+        elif kind == 1:
+            alphabet = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ $%*+-./:"
+        elif kind == 2:
+            alphabet = string.ascii_letters + string.punctuation
+        elif kind == 3:
+            alphabet = "éüñøßçأبت"
+        else:
+            alphabet = "漢字日本語東京"
+        pieces.append("".join(rng.choice(alphabet) for _ in range(length)))
+    return "".join(pieces)
+
+
+def check(count, seed=0):
+    """Compare against qrcode on count random payloads; return the mismatches."""
+    import qr_engine  # qr_engine imports this module
+
+    rng = random.Random(seed)
+    mismatches = []
+    reference_seconds = native_seconds = 0.0
+    for index in range(count):
+        data = random_payload(rng)
+        level = rng.choice("LMQH")
+        error_correction = qr_engine.error_correction_for(level)
+        start = time.perf_counter()
+        try:
+            qr = qr_engine.make_qr(data, level, border=0)
+            expected = np.array(qr.get_matrix(), dtype=bool)
+        except exceptions.DataOverflowError:
+            continue
+        middle = time.perf_counter()
+        modules, version = encode(data, error_correction, border=0)
+        native_seconds += time.perf_counter() - middle
+        reference_seconds += middle - start
+        if version != qr.version or not np.array_equal(modules, expected):
+            mismatches.append((index, level, data))
+    print(f"{count} payloads, {len(mismatches)} mismatches; "
+          f"qrcode {reference_seconds:.2f}s, native {native_seconds:.2f}s")
+    return mismatches
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Differential check of the native encoder against qrcode")
+    parser.add_argument("--check", type=int, nargs="?", const=500, default=500, metavar="N",
+                        help="number of random payloads (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    mismatches = check(args.check, args.seed)
+    for index, level, data in mismatches[:10]:
+        print(f"MISMATCH #{index} ec={level} data={data!r}")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,190 @@
+"""Optional per-stage timing for the QR pipeline.
+
+A trace covers one operation (a preview generation, a save) and collects
+the time spent in each named stage. Stages are recorded by the code that
+does the work:
+
+    with qr_profile.stage("encode"):
+        ...
+
+and a finished trace is handed to every registered sink. With no sinks
+and no pending profiles, start_trace returns None and stage() returns a
+shared no-op context manager, so the instrumented code pays one global
+lookup per stage.
+
+Traces follow the thread that activates them, which lets the app start a
+trace on the Tk thread, fill it in on the render thread and finish it
+after the PhotoImage upload back on the Tk thread.
+"""
+import contextlib
+import cProfile
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger("qr_profile")
+
+_NULL = contextlib.nullcontext()
+_local = threading.local()
+_lock = threading.Lock()
+_sinks = []
+_active = False
+_profile_remaining = 0
+_profile_dir = "."
+_profile_count = 0
+
+
+class Trace:
+    """Stage timings for one operation."""
+
+    def __init__(self, operation, info):
+        self.operation = operation
+        self.info = info
+        self.stages = {}
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self.profiler = None
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def record(self):
+        return {
+            "operation": self.operation,
+            "time": self.started,
+            "total": time.perf_counter() - self._start,
+            "stages": dict(self.stages),
+            **self.info,
+        }
+
+
+class LogSink:
+    """Write each trace as one log line."""
+
+    def __init__(self, log=logger, level=logging.INFO):
+        self.log = log
+        self.level = level
+
+    def __call__(self, record):
+        stages = " ".join(f"{name}={seconds * 1000:.2f}ms" for name, seconds in record["stages"].items())
+        self.log.log(self.level, "%s total=%.2fms %s", record["operation"], record["total"] * 1000, stages)
+
+
+class JSONLSink:
+    """Append each trace as a JSON line to a file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, record):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+
+def _update_active():
+    global _active
+    _active = bool(_sinks) or _profile_remaining > 0
+
+
+def add_sink(sink):
+    """Register a callable that receives every finished trace record."""
+    with _lock:
+        _sinks.append(sink)
+        _update_active()
+    return sink
+
+
+def remove_sink(sink):
+    with _lock:
+        if sink in _sinks:
+            _sinks.remove(sink)
+        _update_active()
+
+
+def profile_next(count, directory="."):
+    """Capture cProfile stats for the next count traces into directory."""
+    global _profile_remaining, _profile_dir
+    with _lock:
+        _profile_remaining = count
+        _profile_dir = directory
+        _update_active()
+
+
+def enabled():
+    return _active
+
+
+def start_trace(operation, **info):
+    """Start a trace, or return None when instrumentation is off."""
+    global _profile_remaining
+    if not _active:
+        return None
+    trace = Trace(operation, info)
+    if _profile_remaining > 0:
+        with _lock:
+            if _profile_remaining > 0:
+                _profile_remaining -= 1
+                trace.profiler = cProfile.Profile()
+                _update_active()
+    return trace
+
+
+@contextlib.contextmanager
+def _activated(trace):
+    previous = getattr(_local, "trace", None)
+    _local.trace = trace
+    if trace.profiler is not None:
+        trace.profiler.enable()
+    try:
+        yield trace
+    finally:
+        if trace.profiler is not None:
+            trace.profiler.disable()
+        _local.trace = previous
+
+
+def activate(trace):
+    """Make trace the current one for this thread while the block runs."""
+    if trace is None:
+        return _NULL
+    return _activated(trace)
+
+
+def stage(name):
+    """Time the block as stage name of the current thread's trace, if any."""
+    if not _active:
+        return _NULL
+    trace = getattr(_local, "trace", None)
+    if trace is None:
+        return _NULL
+    return trace.stage(name)
+
+
+def finish(trace):
+    """Send a trace to the sinks and write its profile, if it has one."""
+    global _profile_count
+    if trace is None:
+        return
+    record = trace.record()
+    if trace.profiler is not None:
+        with _lock:
+            _profile_count += 1
+            number = _profile_count
+        os.makedirs(_profile_dir, exist_ok=True)
+        path = os.path.join(_profile_dir, f"{trace.operation}-{int(trace.started)}-{number}.prof")
+        trace.profiler.dump_stats(path)
+        record["profile"] = path
+    for sink in list(_sinks):
+        try:
+            sink(record)
+        except Exception:
+            logger.exception("Trace sink %r failed", sink)
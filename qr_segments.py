@@ -0,0 +1,251 @@
+"""Data segmentation and one-pass version selection.
+
+qrcode's fit loop encodes the data, looks up a version, and encodes again
+whenever the guess lands in a size class with wider character count
+fields. Here the data is split into numeric / alphanumeric / byte
+segments with the cheapest total bit length (per version class, since
+the count field widths differ), and the smallest version whose capacity
+holds it comes from a precomputed table.
+
+Kanji mode (Shift JIS) is used when the whole payload is kanji; mixing it
+with UTF-8 byte segments would leave readers guessing at the charset.
+"""
+from bisect import bisect_left
+
+from qrcode import base, exceptions, util
+
+MODE_NUMBER = util.MODE_NUMBER
+MODE_ALPHA_NUM = util.MODE_ALPHA_NUM
+MODE_8BIT_BYTE = util.MODE_8BIT_BYTE
+MODE_KANJI = util.MODE_KANJI
+MODES = (MODE_NUMBER, MODE_ALPHA_NUM, MODE_8BIT_BYTE, MODE_KANJI)
+
+NUMERIC = frozenset("0123456789")
+ALPHANUMERIC = frozenset(util.ALPHA_NUM.decode("ascii"))
+
+# Versions sharing the same character count field widths
+VERSION_CLASSES = ((1, 9), (10, 26), (27, 40))
+
+# Data bits available, indexed [error_correction][version] (index 0 unused)
+DATA_BITS = [
+    [0] + [8 * sum(block.data_count for block in base.rs_blocks(version, ec)) for version in range(1, 41)]
+    for ec in range(4)
+]
+
+
+def count_bits(mode, version):
+    """Width of the character count field."""
+    return util.mode_sizes_for_version(version)[mode]
+
+
+def data_bits(mode, count):
+    """Bits taken by count characters (bytes for byte mode) in mode, without header."""
+    if mode == MODE_NUMBER:
+        return 10 * (count // 3) + (0, 4, 7)[count % 3]
+    if mode == MODE_ALPHA_NUM:
+        return 11 * (count // 2) + 6 * (count % 2)
+    if mode == MODE_KANJI:
+        return 13 * count
+    return 8 * count
+
+
+def _max_count(mode, bits):
+    count = 0
+    step = 1 << 12
+    while step:
+        if data_bits(mode, count + step) <= bits:
+            count += step
+        else:
+            step >>= 1
+    return count
+
+
+# Characters (bytes for byte mode) a single-segment symbol holds, indexed
+# CAPACITY[mode][error_correction][version]
+CAPACITY = {
+    mode: [
+        [0] + [_max_count(mode, DATA_BITS[ec][version] - 4 - count_bits(mode, version)) for version in range(1, 41)]
+        for ec in range(4)
+    ]
+    for mode in MODES
+}
+
+
+class Segment(util.QRData):
+    """A run of data in one mode, usable anywhere qrcode takes QRData."""
+
+    def __init__(self, mode, data, length):
+        self.mode = mode
+        self.data = data  # bytes: ASCII digits/alphanumerics, UTF-8, or Shift JIS for kanji
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def bits(self, version):
+        return 4 + count_bits(self.mode, version) + data_bits(self.mode, self.length)
+
+    def write(self, buffer):
+        if self.mode != MODE_KANJI:
+            return super().write(buffer)
+        for i in range(0, len(self.data), 2):
+            code = self.data[i] << 8 | self.data[i + 1]
+            code -= 0x8140 if code <= 0x9FFC else 0xC140
+            buffer.put((code >> 8) * 0xC0 + (code & 0xFF), 13)
+
+    def __repr__(self):
+        return f"Segment({self.mode}, {self.data!r})"
+
+
+def _is_kanji(char):
+    try:
+        encoded = char.encode("shift_jis")
+    except UnicodeEncodeError:
+        return False
+    if len(encoded) != 2:
+        return False
+    code = encoded[0] << 8 | encoded[1]
+    return 0x8140 <= code <= 0x9FFC or 0xE040 <= code <= 0xEBBF
+
+
+def _make_segment(mode, text):
+    if mode == MODE_8BIT_BYTE:
+        data = text.encode("utf-8")
+        return Segment(mode, data, len(data))
+    if mode == MODE_KANJI:
+        return Segment(mode, text.encode("shift_jis"), len(text))
+    return Segment(mode, text.encode("ascii"), len(text))
+
+
+def _steps(text, version):
+    """Run the segmentation DP over text, yielding (costs, written) per character.
+
+    costs[m] is the cheapest encoding so far, in sixths of a bit, that ends
+    with a segment open in modes[m]; written[m] is the mode index the
+    character was written in on that path. Costs are kept in sixths so
+    numeric (10/3 bits) and alphanumeric (11/2 bits) characters are exact.
+    """
+    heads = [(4 + count_bits(mode, version)) * 6 for mode in _DP_MODES]
+    inf = float("inf")
+    costs = list(heads)
+    for char in text:
+        current = [costs[0] + len(char.encode("utf-8")) * 48, inf, inf]
+        written = [0, None, None]
+        if char in ALPHANUMERIC:
+            current[1] = costs[1] + 33
+            written[1] = 1
+        if char in NUMERIC:
+            current[2] = costs[2] + 20
+            written[2] = 2
+        # Close the segment after this character and open one in mode j
+        for j in range(3):
+            for k in range(3):
+                if written[k] is None:
+                    continue
+                cost = (current[k] + 5) // 6 * 6 + heads[j]
+                if cost < current[j]:
+                    current[j] = cost
+                    written[j] = written[k]
+        yield current, written
+        costs = current
+
+
+# Modes the DP chooses between, by index
+_DP_MODES = (MODE_8BIT_BYTE, MODE_ALPHA_NUM, MODE_NUMBER)
+
+
+def prefix_bits(text, version):
+    """Yield the fewest bits, headers included, for text[:1], text[:2], ...
+
+    The counts never decrease, so a caller can stop at the first prefix
+    that no longer fits.
+    """
+    for costs, _ in _steps(text, version):
+        yield (min(costs) + 5) // 6
+
+
+def segment(text, version):
+    """Split text into the segments with the fewest bits for version's class.
+
+    Dynamic programming over the characters (see _steps), then a walk back
+    along the cheapest path.
+    """
+    if not text:
+        return []
+    if all(map(_is_kanji, text)):
+        return [_make_segment(MODE_KANJI, text)]
+
+    char_modes = []  # per character and end state: the mode that character was written in
+    for costs, written in _steps(text, version):
+        char_modes.append(written)
+
+    state = min(range(3), key=lambda m: (costs[m] + 5) // 6)
+    per_char = []
+    for written in reversed(char_modes):
+        state = written[state]
+        per_char.append(state)
+    per_char.reverse()
+
+    segments = []
+    start = 0
+    for i in range(1, len(text) + 1):
+        if i == len(text) or per_char[i] != per_char[start]:
+            segments.append(_make_segment(_DP_MODES[per_char[start]], text[start:i]))
+            start = i
+    return segments
+
+
+def _single_mode(text):
+    """The mode to use for all of text when segmenting can't help, else None."""
+    characters = set(text)
+    if characters <= NUMERIC:
+        return MODE_NUMBER
+    if all(map(_is_kanji, characters)):
+        return MODE_KANJI
+    if characters.isdisjoint(ALPHANUMERIC):
+        return MODE_8BIT_BYTE
+    return None
+
+
+def _lower_bound_bits(text):
+    """Bits the text needs at the very least, ignoring segment headers."""
+    sixths = 0
+    for char in text:
+        if char in NUMERIC:
+            sixths += 20
+        elif char in ALPHANUMERIC:
+            sixths += 33
+        else:
+            sixths += len(char.encode("utf-8")) * 48
+    return sixths // 6
+
+
+def plan(text, error_correction):
+    """Return (version, segments) for the smallest symbol that holds text.
+
+    error_correction is a qrcode ERROR_CORRECT_* constant. Raises
+    qrcode.exceptions.DataOverflowError when even version 40 is too small.
+    """
+    mode = _single_mode(text)
+    if mode is not None:
+        seg = _make_segment(mode, text)
+        version = bisect_left(CAPACITY[mode][error_correction], len(seg), 1)
+        if version > 40:
+            raise exceptions.DataOverflowError(
+                f"Data too long for a QR code at this error correction level ({len(seg)} characters)"
+            )
+        return version, [seg]
+
+    limits = DATA_BITS[error_correction]
+    lower_bound = _lower_bound_bits(text)
+    for first, last in VERSION_CLASSES:
+        if lower_bound > limits[last]:
+            continue
+        segments = segment(text, first)
+        needed = sum(seg.bits(first) for seg in segments)
+        version = bisect_left(limits, needed, first, last + 1)
+        if version <= last:
+            return max(version, 1), segments
+    raise exceptions.DataOverflowError(
+        f"Data too long for a QR code at this error correction level ({lower_bound} bits or more)"
+    )
@@ -0,0 +1,243 @@
+"""Local HTTP service that renders QR codes.
+
+Usage:
+    python -m qr_server --port 8080 --logo-dir logos/
+    python -m qr_server --port 8080 --disk-cache /var/cache/qr --disk-cache-size 4096
+
+    GET /qr?data=hello&ec=H&fill=%23000080&back=white&logo=acme
+
+Query parameters mirror the app's options: data (required), ec (L/M/Q/H),
+fill, back, logo (file name without extension in --logo-dir), box_size and
+border. Rendering runs in a process pool off the event loop; responses
+carry an ETag derived from the PNG bytes and are kept in an LRU cache.
+With --disk-cache, renders also go to a content-addressed DiskCache that
+survives restarts and can be shared with qr_batch --cache; the disk is
+checked on a memory miss, before rendering.
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+import qr_engine
+import qr_export
+from qr_cache import DiskCache, LRUCache
+
+# Longest numeric payload a version 40-L code can hold; longer data is refused
+# before rendering, anything else that doesn't fit is refused by the encoder
+MAX_DATA_LENGTH = 7089
+MAX_BOX_SIZE = 50
+MAX_HEADER_BYTES = 16384
+LOGO_ID = re.compile(r"^[A-Za-z0-9_-]+$")
+LOGO_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".gif", ".webp")
+
+REASONS = {
+    200: "OK",
+    304: "Not Modified",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    500: "Internal Server Error",
+}
+
+
+class BadRequest(Exception):
+    pass
+
+
+def find_logos(logo_dir):
+    """Map logo IDs (file stems) to image paths in logo_dir."""
+    logos = {}
+    if logo_dir:
+        for name in sorted(os.listdir(logo_dir)):
+            stem, ext = os.path.splitext(name)
+            if ext.lower() in LOGO_EXTENSIONS and LOGO_ID.match(stem):
+                logos[stem] = os.path.join(logo_dir, name)
+    return logos
+
+
+# Logos loaded on first use in each worker process
+_worker_logos = {}
+
+
+def _render(data, logo_path, options):
+    logo = None
+    if logo_path:
+        logo = _worker_logos.get(logo_path)
+        if logo is None:
+            logo = _worker_logos[logo_path] = qr_engine.load_logo(logo_path)
+    return qr_engine.render_qr_bytes(data, logo=logo, **options)
+
+
+class QRServer:
+    def __init__(self, logos=None, workers=None, cache_size=1024, max_age=86400, disk_cache=None):
+        self.logos = logos or {}
+        self.max_age = max_age
+        self.cache = LRUCache(cache_size)
+        self.disk_cache = disk_cache
+        # Disk cache keys name the logo by its content, not its ID
+        self.logo_digests = {}
+        if disk_cache is not None:
+            self.logo_digests = {logo_id: qr_engine.load_logo(path).digest for logo_id, path in self.logos.items()}
+        self.pool = ProcessPoolExecutor(workers)
+        self._inflight = {}
+
+    def parse_query(self, query):
+        """Validate query parameters and return (cache key, data, logo path, options)."""
+        params = {name: values[-1] for name, values in parse_qs(query, keep_blank_values=True).items()}
+        data = params.get("data", "")
+        if not data:
+            raise BadRequest("missing 'data'")
+        if len(data) > MAX_DATA_LENGTH:
+            raise BadRequest("'data' is too long")
+        ec = params.get("ec", "L").upper()
+        if ec not in qr_engine.EC_LEVELS:
+            raise BadRequest("'ec' must be one of L, M, Q, H")
+        options = {"error_correction": ec}
+        for name, key in (("fill", "fill_color"), ("back", "back_color")):
+            color = params.get(name, "black" if name == "fill" else "white")
+            try:
+                qr_engine.color_rgba(color)
+            except ValueError:
+                raise BadRequest(f"invalid color for '{name}'")
+            options[key] = color
+        for name, default, low, high in (("box_size", 10, 1, MAX_BOX_SIZE), ("border", 2, 0, 20)):
+            try:
+                value = int(params.get(name, default))
+            except ValueError:
+                raise BadRequest(f"'{name}' must be an integer")
+            if not low <= value <= high:
+                raise BadRequest(f"'{name}' must be between {low} and {high}")
+            options[name] = value
+        logo_id = params.get("logo") or None
+        if logo_id is not None and logo_id not in self.logos:
+            raise BadRequest(f"unknown logo '{logo_id}'")
+        key = (data, logo_id) + tuple(sorted(options.items()))
+        return key, data, self.logos.get(logo_id), options
+
+    async def render(self, query):
+        """Return (etag, png) for a query, from the cache or the worker pool."""
+        key, data, logo_path, options = self.parse_query(query)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        # Identical requests that arrive together share one render
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = asyncio.ensure_future(self._render_uncached(key, data, logo_path, options))
+        return await asyncio.shield(task)
+
+    async def _render_uncached(self, key, data, logo_path, options):
+        loop = asyncio.get_running_loop()
+        try:
+            body = None
+            if self.disk_cache is not None:
+                disk_key = qr_export.export_key(data, self.logo_digests.get(key[1]), **options)
+                # File I/O runs on the default thread pool, off the event loop
+                body = await loop.run_in_executor(None, self.disk_cache.get, disk_key)
+            if body is None:
+                body = await loop.run_in_executor(self.pool, _render, data, logo_path, options)
+                if self.disk_cache is not None:
+                    await loop.run_in_executor(None, self.disk_cache.put, disk_key, body)
+        finally:
+            del self._inflight[key]
+        entry = ('"%s"' % hashlib.sha256(body).hexdigest()[:32], body)
+        self.cache.put(key, entry)
+        return entry
+
+    async def respond(self, method, target, headers):
+        """Return (status, extra headers, body) for one request."""
+        if method not in ("GET", "HEAD"):
+            return 405, {"Allow": "GET, HEAD"}, b"method not allowed\n"
+        url = urlsplit(target)
+        if url.path == "/healthz":
+            return 200, {"Content-Type": "text/plain"}, b"ok\n"
+        if url.path != "/qr":
+            return 404, {"Content-Type": "text/plain"}, b"not found\n"
+        try:
+            etag, body = await self.render(url.query)
+        except BadRequest as e:
+            return 400, {"Content-Type": "text/plain"}, f"{e}\n".encode()
+        except qr_engine.DataOverflowError:
+            # Under MAX_DATA_LENGTH but more than fits in mixed or byte mode
+            return 400, {"Content-Type": "text/plain"}, b"'data' is too long\n"
+        except Exception as e:
+            return 500, {"Content-Type": "text/plain"}, f"render failed: {e}\n".encode()
+        cache_headers = {"ETag": etag, "Cache-Control": f"public, max-age={self.max_age}"}
+        if etag in [tag.strip() for tag in headers.get("if-none-match", "").split(",")]:
+            return 304, cache_headers, b""
+        return 200, dict(cache_headers, **{"Content-Type": "image/png"}), body
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+                lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, target, version = lines[0].split(" ", 2)
+                except ValueError:
+                    break
+                headers = {}
+                for line in lines[1:]:
+                    name, sep, value = line.partition(":")
+                    if sep:
+                        headers[name.strip().lower()] = value.strip()
+                status, extra, body = await self.respond(method, target, headers)
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                response = [f"HTTP/1.1 {status} {REASONS[status]}", f"Content-Length: {len(body)}"]
+                response += [f"{name}: {value}" for name, value in extra.items()]
+                response.append("Connection: " + ("keep-alive" if keep_alive else "close"))
+                writer.write(("\r\n".join(response) + "\r\n\r\n").encode("latin-1"))
+                if method != "HEAD":
+                    writer.write(body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8080):
+        server = await asyncio.start_server(self.handle, host, port, limit=MAX_HEADER_BYTES)
+        addresses = ", ".join(f"http://{s.getsockname()[0]}:{s.getsockname()[1]}" for s in server.sockets)
+        print(f"Serving QR codes on {addresses}", flush=True)
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="qr_server", description="Serve QR codes over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--logo-dir", help="directory of logos, addressed by file name without extension")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="render processes (default: one per CPU)")
+    parser.add_argument("--cache-size", type=int, default=1024, help="responses kept in memory")
+    parser.add_argument("--disk-cache", metavar="DIR", help="directory for a persistent cache of rendered codes")
+    parser.add_argument("--disk-cache-size", type=int, default=1024, metavar="MB",
+                        help="largest total size of --disk-cache (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    disk_cache = DiskCache(args.disk_cache, args.disk_cache_size << 20) if args.disk_cache else None
+    server = QRServer(find_logos(args.logo_dir), args.workers, args.cache_size, disk_cache=disk_cache)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
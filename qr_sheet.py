@@ -0,0 +1,394 @@
+"""Label sheets: many QR codes tiled onto the pages of a PDF or TIFF.
+
+Usage:
+    python -m qr_sheet payloads.csv -o labels.pdf --columns 4 --rows 6
+    python -m qr_sheet payloads.jsonl -o labels.tiff --dpi 300 --logo logo.png
+    python -m qr_sheet payloads.csv -o labels.pdf --caption "{index}: {data}"
+
+Payloads are read like qr_batch does (CSV with a 'data' column or JSONL).
+Rows without data, or with more than fits in a code, are reported on
+stderr and skipped, and the exit status is 1.
+Pages are written as soon as they fill up, so memory holds one page
+whatever the number of labels. PDF pages are vector: each code is drawn
+from its cached module matrix, the logo is a single image shared by every
+page and captions use the built-in Helvetica font. TIFF pages are raster
+at --dpi, pasting the cached code images, bilevel and Group 4 compressed
+when the codes are plain black on white.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont, TiffImagePlugin
+
+import qr_batch
+import qr_engine
+import qr_vector
+
+# Page sizes in points (1/72 inch)
+PAGE_SIZES = {
+    "A4": (595.28, 841.89),
+    "A5": (419.53, 595.28),
+    "LETTER": (612.0, 792.0),
+    "LEGAL": (612.0, 1008.0),
+}
+
+POINTS_PER_MM = 72 / 25.4
+
+# Helvetica advance widths in 1/1000 em for ASCII 32-126; other characters
+# are measured as a digit
+HELVETICA_WIDTHS = (
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+)
+
+# Resolution of the logo image embedded in PDF sheets
+PDF_LOGO_DPI = 300
+
+
+class SheetLayout:
+    """Grid of label cells on a page, in points from the top-left corner.
+
+    Each cell holds a square code of the same size, centered, with room for
+    a one-line caption under it when font_size is non-zero.
+    """
+
+    def __init__(self, page_size=PAGE_SIZES["A4"], columns=4, rows=6, margin=36.0, gap=12.0, font_size=8.0):
+        self.page_width, self.page_height = page_size
+        self.columns = columns
+        self.rows = rows
+        self.margin = margin
+        self.gap = gap
+        self.font_size = font_size
+        self.cell_width = (self.page_width - 2 * margin - (columns - 1) * gap) / columns
+        self.cell_height = (self.page_height - 2 * margin - (rows - 1) * gap) / rows
+        self.caption_height = font_size * 1.6 if font_size else 0.0
+        self.code_size = min(self.cell_width, self.cell_height - self.caption_height)
+        if self.code_size <= 0:
+            raise ValueError("Labels don't fit on the page; use fewer columns/rows or smaller margins")
+
+    @property
+    def per_page(self):
+        return self.columns * self.rows
+
+    def code_origin(self, slot):
+        """Top-left corner of the code in cell number slot (row-major)."""
+        row, column = divmod(slot, self.columns)
+        x = self.margin + column * (self.cell_width + self.gap) + (self.cell_width - self.code_size) / 2
+        y = self.margin + row * (self.cell_height + self.gap)
+        return x, y
+
+
+class Sheet:
+    """Collects labels into pages and hands each full page to _write_page."""
+
+    def __init__(self, layout, error_correction="L", fill_color="black", back_color="white",
+                 logo=None, border=2):
+        if logo is not None and not isinstance(logo, qr_engine.PreparedLogo):
+            logo = qr_engine.PreparedLogo(logo)
+        self.layout = layout
+        self.error_correction = error_correction
+        self.fill_color = fill_color
+        self.back_color = back_color
+        self.logo = logo
+        self.border = border
+        self.pages = 0
+        self.labels = 0
+        self._slot = 0
+
+    def add(self, data, caption=None):
+        """Place a code (and its caption) in the next free cell."""
+        modules, _ = qr_engine.encode(data, self.error_correction, self.border)
+        self.add_symbol(modules, caption, data)
+
+    def add_symbol(self, modules, caption=None, data=None):
+        """Place an already encoded module matrix in the next free cell.
+
+        data, when given, lets raster sheets reuse the cached render.
+        """
+        if self._slot == 0:
+            self._start_page()
+        self._draw(self.layout.code_origin(self._slot), modules, data, caption)
+        self.labels += 1
+        self._slot += 1
+        if self._slot == self.layout.per_page:
+            self._finish_page()
+
+    def _finish_page(self):
+        self._write_page()
+        self.pages += 1
+        self._slot = 0
+
+    def close(self):
+        """Write the last, partly filled page and finish the file."""
+        if self._slot:
+            self._finish_page()
+        self._close()
+
+    def abort(self):
+        """Stop without finishing the file, and remove it when the sheet created it."""
+        self._abort()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # A sheet cut short by an error would look complete; don't leave one behind
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def _caption_width(text, font_size):
+    return sum(HELVETICA_WIDTHS[ord(c) - 32] if 32 <= ord(c) < 127 else 556 for c in text) * font_size / 1000
+
+
+def fit_caption(text, max_width, measure):
+    """Shorten text with "..." until measure(text) fits max_width."""
+    if measure(text) <= max_width:
+        return text
+    # Longest prefix that fits with the ellipsis, by bisection
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if measure(text[:middle] + "...") <= max_width:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low] + "..." if low else ""
+
+
+def _pdf_string(text):
+    data = text.encode("cp1252", "replace")
+    return "(" + data.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)").decode("latin-1") + ")"
+
+
+class PDFSheet(Sheet):
+    """Label sheet written to a file path or binary stream as a multi-page vector PDF."""
+
+    def __init__(self, stream, layout, **options):
+        super().__init__(layout, **options)
+        self._own_stream = isinstance(stream, (str, os.PathLike))
+        if self._own_stream:
+            stream = open(stream, "wb")
+        self.stream = stream
+        self.writer = qr_vector.PDFWriter(stream)
+        self.fonts = {}
+        if layout.font_size:
+            self.fonts["F1"] = self.writer.add(
+                "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"
+            )
+        self.images = {}
+        if self.logo is not None:
+            # One image for every label: the code size on the sheet is fixed
+            pixels = round(layout.code_size * PDF_LOGO_DPI / 72)
+            tile = self.logo.tile(pixels)
+            scale = layout.code_size / pixels
+            self.images["Logo"] = self.writer.add_image(tile)
+            self.logo_box = ((pixels - tile.size[0]) // 2 * scale, (pixels - tile.size[1]) // 2 * scale,
+                             tile.size[0] * scale, tile.size[1] * scale)
+        self.ops = []
+
+    def _start_page(self):
+        self.ops = []
+
+    def _draw(self, origin, modules, data, caption):
+        layout = self.layout
+        x, top = origin
+        size = layout.code_size
+        bottom = layout.page_height - top - size
+        self.ops.append(qr_vector.pdf_code_ops(modules, x, bottom, size / len(modules),
+                                               self.fill_color, self.back_color))
+        if self.logo is not None:
+            left, down, width, height = self.logo_box
+            self.ops.append(f"q {width:g} 0 0 {height:g} {x + left:g} {bottom + size - down - height:g} cm /Logo Do Q")
+        if caption and layout.font_size:
+            text = fit_caption(caption, layout.cell_width, lambda t: _caption_width(t, layout.font_size))
+            text_x = x + (size - _caption_width(text, layout.font_size)) / 2
+            text_y = bottom - layout.font_size * 1.2
+            self.ops.append(f"0 g BT /F1 {layout.font_size:g} Tf {text_x:.2f} {text_y:.2f} Td {_pdf_string(text)} Tj ET")
+
+    def _write_page(self):
+        content = "\n".join(self.ops).encode("latin-1")
+        self.writer.add_page(self.layout.page_width, self.layout.page_height, content, self.images, self.fonts)
+        self.ops = []
+
+    def _close(self):
+        self.writer.close()
+        if self._own_stream:
+            self.stream.close()
+
+    def _abort(self):
+        if self._own_stream:
+            self.stream.close()
+            os.remove(self.stream.name)
+
+
+def _load_font(size):
+    try:
+        return ImageFont.load_default(size)
+    except TypeError:  # Pillow < 10.1 has only the fixed-size bitmap font
+        return ImageFont.load_default()
+
+
+class TIFFSheet(Sheet):
+    """Label sheet written to a file as a multi-page raster TIFF."""
+
+    def __init__(self, path, layout, dpi=300, **options):
+        super().__init__(layout, **options)
+        self.dpi = dpi
+        self.scale = dpi / 72
+        self.page_size = (round(layout.page_width * self.scale), round(layout.page_height * self.scale))
+        self.code_pixels = int(layout.code_size * self.scale)
+        back = qr_engine.color_rgba(self.back_color)
+        self.bilevel = (self.logo is None and qr_engine.color_rgba(self.fill_color) == (0, 0, 0, 255)
+                        and back == (255, 255, 255, 255))
+        self.transparent = back[3] == 0
+        self.font = _load_font(max(1, round(layout.font_size * self.scale))) if layout.font_size else None
+        self.page = None
+        self.draw = None
+        self.path = path
+        self.tiff = TiffImagePlugin.AppendingTiffWriter(path, new=True)
+
+    def _start_page(self):
+        self.page = Image.new("1" if self.bilevel else "RGB", self.page_size, "white")
+        self.draw = ImageDraw.Draw(self.page)
+
+    def _draw(self, origin, modules, data, caption):
+        x, y = (round(value * self.scale) for value in origin)
+        box_size = max(1, self.code_pixels // len(modules))
+        offset = (self.code_pixels - box_size * len(modules)) // 2
+        position = (x + offset, y + offset)
+        if self.bilevel:
+            image = Image.fromarray(~np.asarray(modules).repeat(box_size, axis=0).repeat(box_size, axis=1))
+            self.page.paste(image, position)
+        elif data is None:
+            image = qr_engine.embed_logo(qr_engine.rasterize(modules, box_size, self.fill_color, self.back_color),
+                                         self.logo)
+        else:
+            image = qr_engine.render_qr(data, self.error_correction, self.fill_color, self.back_color,
+                                        self.logo, box_size, self.border)
+        if not self.bilevel:
+            self.page.paste(image, position, image if self.transparent else None)
+        if caption and self.font is not None:
+            width = self.layout.cell_width * self.scale
+            text = fit_caption(caption, width, lambda t: self.draw.textlength(t, font=self.font))
+            self.draw.text((x + self.code_pixels / 2, y + self.code_pixels + self.layout.font_size * 0.4 * self.scale),
+                           text, fill="black", font=self.font, anchor="ma")
+
+    def _write_page(self):
+        compression = "group4" if self.bilevel else "tiff_deflate"
+        self.page.save(self.tiff, format="TIFF", compression=compression, dpi=(self.dpi, self.dpi))
+        self.tiff.newFrame()
+        self.page = self.draw = None
+
+    def _close(self):
+        self.tiff.close()
+
+    def _abort(self):
+        self.tiff.f.close()
+        os.remove(self.path)
+
+
+def open_sheet(path, layout, format=None, dpi=300, **options):
+    """Return a PDFSheet or TIFFSheet writing to path, by format or file extension.
+
+    options are the Sheet keyword arguments (error_correction, fill_color,
+    back_color, logo, border).
+    """
+    format = (format or os.path.splitext(path)[1][1:]).upper()
+    if format == "PDF":
+        return PDFSheet(path, layout, **options)
+    if format in ("TIF", "TIFF"):
+        return TIFFSheet(path, layout, dpi, **options)
+    raise ValueError(f"Unsupported sheet format: {format}")
+
+
+def write_sheet(path, labels, layout, format=None, dpi=300, on_error=None, **options):
+    """Write (data, caption) pairs to a PDF or TIFF sheet; return (pages, labels).
+
+    A label whose data can't be encoded (empty, or too long for any code)
+    is passed to on_error(data, error) and skipped. Without on_error the
+    error is raised and the unfinished file is removed.
+    """
+    with open_sheet(path, layout, format, dpi, **options) as sheet:
+        for data, caption in labels:
+            try:
+                sheet.add(data, caption)
+            except (ValueError, qr_engine.DataOverflowError) as e:
+                if on_error is None:
+                    raise
+                on_error(data, e)
+    return sheet.pages, sheet.labels
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="qr_sheet", description="Tile QR codes onto printable label sheets.")
+    parser.add_argument("input", help="CSV or JSONL file with the payloads")
+    parser.add_argument("-o", "--output", required=True, help="output .pdf or .tiff file")
+    parser.add_argument("--page", default="A4", type=str.upper, choices=sorted(PAGE_SIZES))
+    parser.add_argument("--landscape", action="store_true")
+    parser.add_argument("--columns", type=int, default=4)
+    parser.add_argument("--rows", type=int, default=6)
+    parser.add_argument("--margin", type=float, default=12.7, help="page margin in mm")
+    parser.add_argument("--gap", type=float, default=4.0, help="space between labels in mm")
+    parser.add_argument("--font-size", type=float, default=8.0, help="caption size in points, 0 for no captions")
+    parser.add_argument("--caption", default="{data}",
+                        help="caption template with {index}, {data} and any input column (default: %(default)s)")
+    parser.add_argument("--dpi", type=int, default=300, help="TIFF resolution")
+    parser.add_argument("--ec", default="L", choices=sorted(qr_engine.EC_LEVELS), help="error correction level")
+    parser.add_argument("--fill", default="black", help="module color")
+    parser.add_argument("--back", default="white", help="background color")
+    parser.add_argument("--logo", help="logo image embedded in every code")
+    parser.add_argument("--border", type=int, default=2, help="quiet zone in modules")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    page_size = PAGE_SIZES[args.page]
+    if args.landscape:
+        page_size = page_size[::-1]
+    layout = SheetLayout(page_size, args.columns, args.rows, args.margin * POINTS_PER_MM,
+                         args.gap * POINTS_PER_MM, args.font_size)
+    logo = qr_engine.load_logo(args.logo) if args.logo else None
+
+    errors = 0
+    row_number = 0  # of the row being written, for reporting it
+
+    def report(error):
+        nonlocal errors
+        errors += 1
+        print(f"{args.input}: row {row_number}: {error}", file=sys.stderr)
+
+    def labels():
+        nonlocal row_number
+        for index, row in enumerate(qr_batch.read_jobs(args.input)):
+            row_number = index + 1
+            try:
+                data = qr_batch.row_data(row)
+            except ValueError as e:
+                report(e)
+                continue
+            yield data, args.caption.format_map({**row, "index": index, "data": data})
+
+    start = time.perf_counter()
+    pages, count = write_sheet(args.output, labels(), layout, dpi=args.dpi, on_error=lambda data, e: report(e),
+                               error_correction=args.ec, fill_color=args.fill, back_color=args.back, logo=logo,
+                               border=args.border)
+    elapsed = time.perf_counter() - start
+    print(f"Wrote {count} labels on {pages} pages to {args.output} in {elapsed:.2f}s")
+    if errors:
+        print(f"Skipped {errors} rows that could not be encoded (see above)")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
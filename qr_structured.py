@@ -0,0 +1,283 @@
+"""Structured append: one payload spread over a sequence of QR codes.
+
+Usage:
+    python -m qr_structured big.txt -o parts.png
+    python -m qr_structured big.txt -o parts.pdf --max-version 8 --ec M
+    python -m qr_structured - -o parts.svg -j 4 < big.txt
+
+Data that would need a large, slow to render and hard to scan symbol is
+split into up to 16 smaller ones. Each starts with a structured append
+header (mode 0011, its position, the symbol count and a parity byte over
+the whole payload) that tells a reader how to join them back. Splits only
+fall between characters. The symbol count is the smallest that works at
+--max-version, and the version the smallest that keeps that count, so all
+symbols but the last come out the same size.
+
+Output ending in .pdf or .tiff is a label sheet of all symbols; anything
+else writes one file per symbol (parts-01of05.png, ...).
+"""
+import argparse
+import os
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import reduce
+from math import ceil
+
+import numpy as np
+from PIL import Image
+from qrcode import exceptions
+
+import qr_engine
+import qr_export
+import qr_native
+import qr_segments
+import qr_sheet
+from qr_cache import LRUCache
+
+MODE_STRUCTURED_APPEND = 0b0011
+HEADER_BITS = 4 + 4 + 4 + 8
+MAX_SYMBOLS = 16
+
+# Largest version a part may use; keeps every symbol quick to render and scan
+DEFAULT_MAX_VERSION = 10
+
+Part = namedtuple("Part", "text version segments")
+Symbol = namedtuple("Symbol", "index total parity version text modules")
+
+# Encoded symbol sequences keyed by (data, error_correction, border, max_version)
+symbol_cache = LRUCache(16)
+
+
+def parity(parts):
+    """XOR of every data byte of the whole payload, as the header carries it."""
+    return reduce(lambda value, byte: value ^ byte,
+                  (byte for part in parts for segment in part.segments for byte in segment.data), 0)
+
+
+def header(index, total, parity_byte):
+    """Structured append header as (values, widths) bit fields."""
+    return (MODE_STRUCTURED_APPEND, index, total - 1, parity_byte), (4, 4, 4, 8)
+
+
+def _part(text, error_correction, max_version, header_bits):
+    """Part for text at the smallest version up to max_version, or None if it doesn't fit."""
+    limits = qr_segments.DATA_BITS[error_correction]
+    for first, last in qr_segments.VERSION_CLASSES:
+        if first > max_version:
+            break
+        last = min(last, max_version)
+        segments = qr_segments.segment(text, first)
+        needed = header_bits + sum(segment.bits(first) for segment in segments)
+        for version in range(first, last + 1):
+            if needed <= limits[version]:
+                return Part(text, version, segments)
+    return None
+
+
+def _split_greedy(text, error_correction, version):
+    """Cut text into the longest prefixes that fit version with a header; None past 16."""
+    parts = []
+    limit = qr_segments.DATA_BITS[error_correction][version] - HEADER_BITS
+    start = 0
+    while start < len(text):
+        if len(parts) == MAX_SYMBOLS:
+            return None
+        length = 0
+        for bits in qr_segments.prefix_bits(text[start:], version):
+            if bits > limit:
+                break
+            length += 1
+        if length == 0:
+            return None
+        parts.append(_part(text[start:start + length], error_correction, version, HEADER_BITS))
+        start += length
+    return parts
+
+
+def split(data, error_correction="L", max_version=DEFAULT_MAX_VERSION):
+    """Split data into Parts for a structured append sequence.
+
+    Uses the fewest symbols of at most max_version, then the smallest
+    version that still needs no more symbols than that. Data that fits a
+    single symbol comes back as one Part, to be encoded without a header.
+    Raises DataOverflowError when 16 symbols of max_version aren't enough.
+    """
+    if not data:
+        raise ValueError("No data to encode")
+    error_correction = qr_engine.error_correction_for(error_correction)
+    single = _part(data, error_correction, max_version, 0)
+    if single is not None:
+        return [single]
+    parts = _split_greedy(data, error_correction, max_version)
+    if parts is None:
+        raise exceptions.DataOverflowError(
+            f"Data too long for {MAX_SYMBOLS} symbols of version {max_version} or less"
+        )
+    # The symbol count only grows as the version shrinks, so bisect the
+    # smallest version that keeps it
+    low, high = 1, max_version
+    while low < high:
+        middle = (low + high) // 2
+        candidate = _split_greedy(data, error_correction, middle)
+        if candidate is not None and len(candidate) == len(parts):
+            high = middle
+            parts = candidate
+        else:
+            low = middle + 1
+    return parts
+
+
+def _encode_part(part, index, total, parity_byte, error_correction, border):
+    fields = header(index, total, parity_byte) if total > 1 else None
+    modules = qr_native.encode_segments(part.segments, part.version, error_correction, header=fields)
+    if border:
+        modules = np.pad(modules, border)
+    modules.flags.writeable = False
+    return modules
+
+
+def encode_symbols(data, error_correction="L", border=2, max_version=DEFAULT_MAX_VERSION, executor=None):
+    """Split and encode data; return the Symbols in sequence order.
+
+    With an executor (a ProcessPoolExecutor for real parallelism) the parts
+    are encoded concurrently. Results are cached in symbol_cache.
+    """
+    key = (data, error_correction, border, max_version)
+    cached = symbol_cache.get(key)
+    if cached is not None:
+        return cached
+    parts = split(data, error_correction, max_version)
+    total = len(parts)
+    parity_byte = parity(parts)
+    level = qr_engine.error_correction_for(error_correction)
+    jobs = [(part, index, total, parity_byte, level, border) for index, part in enumerate(parts)]
+    if executor is None or total == 1:
+        matrices = [_encode_part(*job) for job in jobs]
+    else:
+        matrices = list(executor.map(_encode_part, *zip(*jobs)))
+    symbols = [Symbol(index, total, parity_byte, part.version, part.text, modules)
+               for index, (part, modules) in enumerate(zip(parts, matrices))]
+    symbol_cache.put(key, symbols)
+    return symbols
+
+
+def render_symbol(symbol, box_size=10, fill_color="black", back_color="white", logo=None):
+    """RGBA image of one symbol."""
+    return qr_engine.embed_logo(qr_engine.rasterize(symbol.modules, box_size, fill_color, back_color), logo)
+
+
+def preview_strip(symbols, size=qr_engine.PREVIEW_SIZE, fill_color="black", back_color="white", logo=None):
+    """All symbols in reading order on a transparent size x size image.
+
+    The symbols run left to right in as many rows as give them the most
+    room, each with a whole number of pixels per module.
+    """
+    count = len(symbols)
+    columns = max(range(1, count + 1), key=lambda c: min(size // c, size // ceil(count / c)))
+    rows = ceil(count / columns)
+    cell = min(size // columns, size // rows)
+    strip = Image.new("RGBA", (size, size), (0, 0, 0, 0))
+    left = (size - columns * cell) // 2
+    top = (size - rows * cell) // 2
+    for symbol in symbols:
+        row, column = divmod(symbol.index, columns)
+        box_size = max(1, cell // len(symbol.modules))
+        image = render_symbol(symbol, box_size, fill_color, back_color, logo)
+        offset = (cell - image.size[0]) // 2
+        strip.paste(image, (left + column * cell + offset, top + row * cell + offset))
+    return strip
+
+
+def set_paths(path, total):
+    """File names for a set: parts.png -> parts-01of05.png, ..."""
+    root, extension = os.path.splitext(path)
+    if total == 1:
+        return [path]
+    return [f"{root}-{index + 1:02d}of{total:02d}{extension}" for index in range(total)]
+
+
+def save_set(path, symbols, format=None, **options):
+    """Write one file per symbol, named from path by set_paths; return the paths.
+
+    options are export_modules keyword arguments (fill_color, back_color,
+    logo, box_size, compress_level, ...).
+    """
+    format = format or os.path.splitext(path)[1][1:] or "PNG"
+    paths = set_paths(path, len(symbols))
+    for symbol, symbol_path in zip(symbols, paths):
+        result = qr_export.export_modules(symbol.modules, format, **options)
+        with open(symbol_path, "wb") as f:
+            f.write(result.data)
+    return paths
+
+
+def save_sheet(path, symbols, layout=None, dpi=300, **options):
+    """Tile the symbols, captioned "1/5", "2/5", ..., onto a PDF or TIFF sheet.
+
+    options are Sheet keyword arguments (fill_color, back_color, logo).
+    """
+    if layout is None:
+        columns = min(len(symbols), 4)
+        layout = qr_sheet.SheetLayout(columns=columns, rows=max(1, min(6, ceil(len(symbols) / columns))))
+    with qr_sheet.open_sheet(path, layout, dpi=dpi, **options) as sheet:
+        for symbol in symbols:
+            sheet.add_symbol(symbol.modules, f"{symbol.index + 1}/{symbol.total}")
+    return sheet.pages
+
+
+def is_sheet_path(path):
+    return os.path.splitext(path)[1].lower() in (".pdf", ".tif", ".tiff")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="qr_structured", description="Split a payload over a structured append sequence.")
+    parser.add_argument("input", help="text file with the payload, - for stdin")
+    parser.add_argument("-o", "--output", required=True,
+                        help="sheet (.pdf, .tiff) or file name pattern for the set (.png, .webp, .svg)")
+    parser.add_argument("--ec", default="L", choices=sorted(qr_engine.EC_LEVELS), help="error correction level")
+    parser.add_argument("--max-version", type=int, default=DEFAULT_MAX_VERSION, choices=range(1, 41), metavar="1-40",
+                        help="largest symbol version (default: %(default)s)")
+    parser.add_argument("--fill", default="black", help="module color")
+    parser.add_argument("--back", default="white", help="background color")
+    parser.add_argument("--logo", help="logo image embedded in every symbol")
+    parser.add_argument("--box-size", type=int, default=10, help="pixels per module for image sets")
+    parser.add_argument("--border", type=int, default=4, help="quiet zone in modules")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="worker processes for encoding (default: one per CPU, 1 encodes in-process)")
+    args = parser.parse_args(argv)
+
+    if args.input == "-":
+        data = sys.stdin.read()
+    else:
+        with open(args.input, encoding="utf-8") as f:
+            data = f.read()
+    data = data.rstrip("\n")
+    logo = qr_engine.load_logo(args.logo) if args.logo else None
+
+    start = time.perf_counter()
+    workers = args.workers or os.cpu_count() or 1
+    if workers > 1:
+        with ProcessPoolExecutor(workers) as pool:
+            symbols = encode_symbols(data, args.ec, args.border, args.max_version, pool)
+    else:
+        symbols = encode_symbols(data, args.ec, args.border, args.max_version)
+    encoded = time.perf_counter()
+
+    colors = {"fill_color": args.fill, "back_color": args.back, "logo": logo}
+    if is_sheet_path(args.output):
+        pages = save_sheet(args.output, symbols, **colors)
+        written = f"{pages} page(s) in {args.output}"
+    else:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        paths = save_set(args.output, symbols, box_size=args.box_size, **colors)
+        written = f"{len(paths)} file(s) like {paths[0]}"
+    versions = sorted({symbol.version for symbol in symbols})
+    print(f"{len(data)} characters in {len(symbols)} symbol(s) of version {'/'.join(map(str, versions))}, "
+          f"encoded in {(encoded - start) * 1000:.1f} ms; wrote {written}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,202 @@
+"""SVG and PDF output built straight from the module matrix.
+
+Dark modules are merged into rectangles (horizontal runs, then identical
+runs on consecutive rows), so output size and build time scale with the
+number of runs rather than with pixels. A logo is embedded once as an
+image.
+"""
+import base64
+import io
+import zlib
+
+import numpy as np
+
+import qr_engine
+
+
+def dark_rects(modules):
+    """Return (x, y, width, height) rectangles covering the dark modules."""
+    modules = np.asarray(modules, dtype=bool)
+    padded = np.zeros((modules.shape[0], modules.shape[1] + 2), dtype=np.int8)
+    padded[:, 1:-1] = modules
+    edges = np.diff(padded, axis=1)
+    starts_y, starts_x = np.nonzero(edges == 1)
+    ends_x = np.nonzero(edges == -1)[1]
+
+    rects = []
+    previous = {}  # (x, width) -> index of a rectangle ending on the previous row
+    current = {}
+    row = -1
+    for y, x, end in zip(starts_y.tolist(), starts_x.tolist(), ends_x.tolist()):
+        if y != row:
+            previous = current if y == row + 1 else {}
+            current = {}
+            row = y
+        run = (x, end - x)
+        index = previous.get(run)
+        if index is None:
+            index = len(rects)
+            rects.append([x, y, end - x, 1])
+        else:
+            rects[index][3] += 1
+        current[run] = index
+    return [tuple(rect) for rect in rects]
+
+
+def _hex(color):
+    r, g, b, a = qr_engine.color_rgba(color)
+    return None if a == 0 else f"#{r:02x}{g:02x}{b:02x}"
+
+
+def _logo_box(size, logo):
+    """Logo tile and its (x, y) position for a code size pixels wide, like embed_logo."""
+    tile = logo.tile(size)
+    return tile, ((size - tile.size[0]) // 2, (size - tile.size[1]) // 2)
+
+
+def _png(image):
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
+
+
+def to_svg(modules, box_size=10, fill_color="black", back_color="white", logo=None):
+    """Return an SVG document for a module matrix as UTF-8 bytes."""
+    count = len(modules)
+    size = count * box_size
+    parts = [
+        '<?xml version="1.0" encoding="UTF-8"?>\n',
+        f'<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" '
+        f'width="{size}" height="{size}" viewBox="0 0 {count} {count}" shape-rendering="crispEdges">\n',
+    ]
+    back = _hex(back_color)
+    if back:
+        parts.append(f'<rect width="{count}" height="{count}" fill="{back}"/>\n')
+    path = "".join(f"M{x} {y}h{w}v{h}h-{w}z" for x, y, w, h in dark_rects(modules))
+    parts.append(f'<path fill="{_hex(fill_color) or "none"}" d="{path}"/>\n')
+    if logo is not None:
+        tile, (x, y) = _logo_box(size, logo)
+        href = "data:image/png;base64," + base64.b64encode(_png(tile)).decode("ascii")
+        parts.append(
+            f'<image x="{x / box_size:g}" y="{y / box_size:g}" width="{tile.size[0] / box_size:g}" '
+            f'height="{tile.size[1] / box_size:g}" preserveAspectRatio="none" xlink:href="{href}"/>\n'
+        )
+    parts.append("</svg>\n")
+    return "".join(parts).encode("utf-8")
+
+
+class PDFWriter:
+    """Minimal PDF writer that streams each object to the file as it is added.
+
+    Pages are collected by object number only, so documents of any length
+    need memory for one page at a time.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.position = 0
+        self.offsets = {}
+        self.page_numbers = []
+        self._next_number = 1
+        self.pages_number = self.reserve()
+        self._write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def _write(self, data):
+        self.stream.write(data)
+        self.position += len(data)
+
+    def reserve(self):
+        """Allocate an object number to be written later."""
+        number = self._next_number
+        self._next_number += 1
+        return number
+
+    def add(self, body, number=None):
+        """Write an object (body as bytes or str) and return its number."""
+        if number is None:
+            number = self.reserve()
+        if isinstance(body, str):
+            body = body.encode("latin-1")
+        self.offsets[number] = self.position
+        self._write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+        return number
+
+    def add_stream(self, data, entries="", compress=True):
+        if compress:
+            data = zlib.compress(data)
+            entries += " /Filter /FlateDecode"
+        header = f"<< /Length {len(data)} {entries} >>\nstream\n".encode("latin-1")
+        return self.add(header + data + b"\nendstream")
+
+    def add_image(self, image):
+        """Write an RGBA PIL image as an image XObject with a soft mask."""
+        image = image.convert("RGBA")
+        width, height = image.size
+        common = f"/Type /XObject /Subtype /Image /Width {width} /Height {height} /BitsPerComponent 8"
+        alpha = self.add_stream(image.getchannel("A").tobytes(), common + " /ColorSpace /DeviceGray")
+        return self.add_stream(image.convert("RGB").tobytes(), common + f" /ColorSpace /DeviceRGB /SMask {alpha} 0 R")
+
+    def add_page(self, width, height, content, images=None, fonts=None):
+        """Write a page with the given content stream, images and fonts by resource name."""
+        content_number = self.add_stream(content)
+        resources = ""
+        if images:
+            resources += " /XObject << " + " ".join(f"/{name} {number} 0 R" for name, number in images.items()) + " >>"
+        if fonts:
+            resources += " /Font << " + " ".join(f"/{name} {number} 0 R" for name, number in fonts.items()) + " >>"
+        self.page_numbers.append(self.add(
+            f"<< /Type /Page /Parent {self.pages_number} 0 R /MediaBox [0 0 {width:g} {height:g}] "
+            f"/Resources <<{resources} >> /Contents {content_number} 0 R >>"
+        ))
+
+    def close(self):
+        """Write the page tree, catalog and cross-reference table."""
+        kids = " ".join(f"{number} 0 R" for number in self.page_numbers)
+        self.add(f"<< /Type /Pages /Kids [{kids}] /Count {len(self.page_numbers)} >>", self.pages_number)
+        catalog = self.add(f"<< /Type /Catalog /Pages {self.pages_number} 0 R >>")
+        xref_position = self.position
+        lines = [f"xref\n0 {self._next_number}\n", "0000000000 65535 f \n"]
+        lines += [f"{self.offsets[number]:010d} 00000 n \n" for number in range(1, self._next_number)]
+        lines.append(f"trailer\n<< /Size {self._next_number} /Root {catalog} 0 R >>\nstartxref\n{xref_position}\n%%EOF\n")
+        self._write("".join(lines).encode("latin-1"))
+
+
+def _rgb_operands(color):
+    r, g, b, _ = qr_engine.color_rgba(color)
+    return f"{r / 255:.4g} {g / 255:.4g} {b / 255:.4g}"
+
+
+def pdf_code_ops(modules, x, y, box_size, fill_color="black", back_color="white"):
+    """PDF content operators drawing a code with its bottom-left corner at (x, y) in points."""
+    count = len(modules)
+    size = count * box_size
+    top = y + size
+    ops = []
+    if qr_engine.color_rgba(back_color)[3]:
+        ops.append(f"{_rgb_operands(back_color)} rg {x:g} {y:g} {size:g} {size:g} re f")
+    ops.append(f"{_rgb_operands(fill_color)} rg")
+    ops += [
+        f"{x + rx * box_size:g} {top - (ry + rh) * box_size:g} {rw * box_size:g} {rh * box_size:g} re"
+        for rx, ry, rw, rh in dark_rects(modules)
+    ]
+    ops.append("f")
+    return "\n".join(ops)
+
+
+def to_pdf(modules, box_size=10, fill_color="black", back_color="white", logo=None):
+    """Return a one-page PDF for a module matrix, one point per pixel."""
+    size = len(modules) * box_size
+    ops = [pdf_code_ops(modules, 0, 0, box_size, fill_color, back_color)]
+    buffer = io.BytesIO()
+    writer = PDFWriter(buffer)
+    images = {}
+    if logo is not None:
+        tile, (x, y) = _logo_box(size, logo)
+        images["Logo"] = writer.add_image(tile)
+        ops.append(f"q {tile.size[0]} 0 0 {tile.size[1]} {x} {size - y - tile.size[1]} cm /Logo Do Q")
+    writer.add_page(size, size, "\n".join(ops).encode("latin-1"), images)
+    writer.close()
+    return buffer.getvalue()
+
+
+VECTOR_FORMATS = {"SVG": to_svg, "PDF": to_pdf}